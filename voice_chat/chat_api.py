@@ -1,22 +1,31 @@
-from fastapi import FastAPI, Response, File, UploadFile, HTTPException, Form
-from fastapi.responses import StreamingResponse, JSONResponse
+from fastapi import (
+    FastAPI,
+    Response,
+    File,
+    UploadFile,
+    HTTPException,
+    Form,
+    Depends,
+)
+from fastapi.responses import StreamingResponse, JSONResponse, ORJSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-
-import requests
-import uuid
+from fastapi.staticfiles import StaticFiles
+from starlette.concurrency import run_in_threadpool
+
+import asyncio
+import hashlib
+import threading
+import httpx
+import aiofiles
+import orjson
 import shutil
 from pathlib import Path
 import base64
-import math
 import urllib
 
-from PIL import Image
-import io
-
 from pydantic import BaseModel
-from typing import List, Optional, Union, Dict, Any, Iterator, Tuple
+from typing import List, Optional, Union, Dict, Any, Iterator, AsyncIterator, Tuple
 from dotenv import load_dotenv
-from uuid import uuid4
 from attr import define, field, Factory
 import argparse
 import os
@@ -30,17 +39,23 @@ from datetime import datetime
 
 import azure.cognitiveservices.speech as speechsdk
 
-from voice_chat.yak_agents import YakAgent, YakStatus, ServiceAgent
+from voice_chat.yak_agents import YakAgent, YakStatus, ServiceAgent, AgentRegistry
 from voice_chat.data_classes.chat_data_classes import (
     ApiUserMessage,
     AppParameters,
     SessionStart,
     SttTokenRequest,
     ServiceAgentRequest,
+    MenuFieldUpdate,
     StdResponse,
     MultiPartResponse,
 )
-from voice_chat.data_classes.data_models import Menu, Cafe, ImageSelector
+from voice_chat.data_classes.data_models import (
+    Menu,
+    Cafe,
+    ImageSelector,
+    MENU_IMAGE_ROUTE,
+)
 from voice_chat.data_classes.mongodb_helper import (
     MenuHelper,
     DatabaseConfig,
@@ -50,8 +65,10 @@ from voice_chat.data_classes.mongodb_helper import (
 
 from bson import ObjectId
 
-from voice_chat.utils import DataProxy
-from voice_chat.service.azure_TTS import AzureTextToSpeech, AzureTTSViseme
+from voice_chat.utils import DataProxy, sid
+from voice_chat.utils.stream_utils import iterate_in_thread, multipart_file_upload
+from voice_chat.utils.image_processing import make_thumbnail
+from voice_chat.service.azure_TTS import AzureTextToSpeech, AzureTTSViseme, TTSPool
 
 from griptape.structures import Agent
 from griptape.utils import Chat, PromptStack
@@ -63,12 +80,20 @@ from griptape.artifacts import TextArtifact
 from griptape.memory.structure import Run
 
 from omegaconf import OmegaConf, DictConfig
+from cachetools import TTLCache
 
 _ALL_TASKS = ["chat_with_agent:post", "chat:post", "llm_params:get"]
 _DEFAULT_BUSINESS_UID = "all"
 _MENU_RULE_PREFIX = "Below is the menu for a cafe:\n\n"
+_STREAMING_HEADERS = {
+    "X-Accel-Buffering": "no",
+    "Cache-Control": "no-cache",
+}  # Stop proxies (e.g. nginx) buffering streamed chunks.
+_SSE_HEADERS = _STREAMING_HEADERS | {"Connection": "keep-alive"}
+_UPLOAD_CHUNK_SIZE = 1 << 20  # bytes
+_RULE_CACHE_TTL_SECONDS = 300
 
-app = FastAPI()
+app = FastAPI(default_response_class=ORJSONResponse)
 
 """
     Deal with CORS issues of browser calling browser from different ports or names.
@@ -84,12 +109,78 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-agent_registry = {}  # Used to store one agent per session.
+
+class CachedStaticFiles(StaticFiles):
+    """Menu image files are never overwritten (file names are unique ids) so browsers can cache them."""
+
+    def file_response(self, *args, **kwargs) -> Response:
+        response = super().file_response(*args, **kwargs)
+        response.headers["Cache-Control"] = "public, max-age=86400, immutable"
+        return response
+
+
+_SESSION_TTL_SECONDS = 3600  # Idle sessions are evicted after this time.
+_SESSION_EXPIRY_INTERVAL_SECONDS = 60
+agent_registry = AgentRegistry(
+    maxsize=10_000, ttl=_SESSION_TTL_SECONDS
+)  # Used to store one agent per session.
+
+# Speech synthesizers are expensive to create so they are reused across requests.
+tts_pool = TTSPool()
+
+# Shared async http client so that calls to 3rd party services (STT tokens, OCR) reuse pooled keep-alive connections.
+# Failed connection attempts are retried by the transport. Note: limits must be set on the transport when one is passed in.
+http_client = httpx.AsyncClient(
+    timeout=httpx.Timeout(30.0, connect=5.0),
+    transport=httpx.AsyncHTTPTransport(
+        retries=2,
+        limits=httpx.Limits(
+            max_connections=100, max_keepalive_connections=20, keepalive_expiry=60.0
+        ),
+    ),
+)
+
+
+# Assembled agent rules keyed by (business_uid, menu_id, digest of avatar personality)
+_rule_cache: TTLCache = TTLCache(maxsize=1024, ttl=_RULE_CACHE_TTL_SECONDS)
+_rule_cache_lock = threading.Lock()
 
 
-def my_gen(response: Iterator[TextArtifact]) -> str:
-    for chunk in response:
-        yield chunk.value
+def invalidate_rule_cache(business_uid: str) -> None:
+    """Drop the cached rules for a business. Call after any change to its menus or settings."""
+    with _rule_cache_lock:
+        for key in [key for key in _rule_cache.keys() if key[0] == business_uid]:
+            _rule_cache.pop(key, None)
+
+
+_SSE_DONE_FRAME = b'data: {"done":true}\n\n'
+
+
+async def my_gen(response: Iterator[TextArtifact]) -> AsyncIterator[bytes]:
+    """Frame the streamed tokens as server-sent events. The final event signals the end of the response."""
+    async for chunk in iterate_in_thread(response):
+        yield b"data: " + orjson.dumps({"token": chunk.value}) + b"\n\n"
+    yield _SSE_DONE_FRAME
+
+
+async def expire_sessions():
+    """Periodically evict idle sessions so that their agents (and conversation memory) are released."""
+    while True:
+        await asyncio.sleep(_SESSION_EXPIRY_INTERVAL_SECONDS)
+        agent_registry.expire()
+
+
+@app.on_event("startup")
+async def startup():
+    await database.ensure_indexes()
+    app.state.session_expiry_task = asyncio.create_task(expire_sessions())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.session_expiry_task.cancel()
+    await http_client.aclose()
+    database.client.close()
 
 
 @app.get("/test_connection")
@@ -99,7 +190,7 @@ def test_connection():
 
 
 @app.post("/get_temp_token")
-def get_temp_token(req: SttTokenRequest) -> Dict:
+async def get_temp_token(req: SttTokenRequest) -> Dict:
     """
     Get time temporary token api token for requested stt service based on the service_configurations data.
     """
@@ -121,10 +212,10 @@ def get_temp_token(req: SttTokenRequest) -> Dict:
         "Content-Type": "application/json",
         "Authorization": service_config["api_token"],
     }
-    r = requests.post(
+    r = await http_client.post(
         url=service_config["api_endpoint"],
         headers=headers,
-        data=json.dumps({"expires_in": service_config["duration"]}),
+        content=json.dumps({"expires_in": service_config["duration"]}),
     )
 
     if r.status_code == 200:
@@ -135,22 +226,41 @@ def get_temp_token(req: SttTokenRequest) -> Dict:
     return {"temp_token": temp_token}
 
 
+def require_yak(session_id: str) -> YakAgent:
+    """Get the agent for the session. Responds 404 if the session doesn't exist or its agent hasn't been created yet."""
+    yak: YakAgent = agent_registry.get(session_id)
+    if yak is None:
+        raise HTTPException(
+            status_code=404,
+            detail="No agent found. An agent must be created prior to starting chat.",
+        )
+    return yak
+
+
 @app.get("/agent/reservation/")
 def agent_reservation():
     """
     Create a placeholder in the agent registry and return a session_id.
     The agent will be created when the conversatino starts.
     """
-    session_id: str = str(uuid4())
+    session_id: str = sid()
     logger.info(
         f"Session ID {session_id} reserved"
     )  # TODO add time limit for session_id to expire.
-    agent_registry[session_id] = None
+    agent_registry.reserve(session_id)
     return {"session_id": session_id}
 
 
+@app.delete("/agent/{session_id}")
+def agent_delete(session_id: str):
+    """End the session and release the agent."""
+    ok: bool = agent_registry.remove(session_id)
+    logger.info(f"Session ID {session_id} deleted: {ok}")
+    return StdResponse(ok, "" if ok else f"No session {session_id}", "").to_dict()
+
+
 @app.post("/agent/create/")
-def agent_create(config: SessionStart) -> Dict:
+async def agent_create(config: SessionStart) -> Dict:
     """
     Create an instance of an Agent and save it to the agent_registry.
     Arguments:
@@ -161,53 +271,76 @@ def agent_create(config: SessionStart) -> Dict:
         stream: boolean indicating if response from chat should be streamed back.
         user_id: a unique id for the user supplied by authentication tool.
     Returns:
-        session_id: str(uuid4): the session_id under which the agent is registered.
+        session_id: str: the session_id under which the agent is registered.
     """
     yak_agent = None
     msg: str = ""
     ok: bool = False
 
     try:
-        cafe: Cafe = MenuHelper.get_cafe(database, business_uid=config.business_uid)
-        menu: Menu = MenuHelper.get_one_menu(
-            database, business_uid=config.business_uid, menu_id=config.menu_id
+        avatar_personality: str = config.avatar_personality or ""
+        rule_key: Tuple = (
+            config.business_uid,
+            config.menu_id,
+            hashlib.blake2b(avatar_personality.encode(), digest_size=8).digest(),
+        )
+        with _rule_cache_lock:
+            rule_set: List[str] = _rule_cache.get(rule_key)
+
+        # The menu text is only needed to build the rules, so it isn't fetched on a rule cache hit.
+        cafe, menu = await MenuHelper.get_cafe_with_menu(
+            database,
+            business_uid=config.business_uid,
+            menu_id=config.menu_id,
+            with_menu=rule_set is None,
         )
-        if menu is None:
+        if cafe is None:
             return {
                 "status": "error",
-                "msg": f"Menu {config.menu_id} not found",
+                "msg": f"Business {config.business_uid} not found",
                 "payload": "",
             }
 
+        if rule_set is None:
+            if menu is None:
+                return {
+                    "status": "error",
+                    "msg": f"Menu {config.menu_id} not found",
+                    "payload": "",
+                }
+            rule_set = [_MENU_RULE_PREFIX + "\n" + (menu.get("menu_text") or "")]
+            rule_set.extend((menu.get("rules") or "").split("\n"))
+            rule_set.extend((cafe["house_rules"] or "").split("\n"))
+            rule_set.extend(avatar_personality.split("\n"))
+            rule_set = list(filter(lambda x: len(x.strip()) > 0, rule_set))
+            with _rule_cache_lock:
+                _rule_cache[rule_key] = rule_set
+
         logger.info(f"Creating agent for: {config.business_uid} in {config.session_id}")
 
         if config.user_id is not None:
             raise NotImplementedError("User based customisation not yet implemented.")
         else:
-            rule_set: List[str] = [_MENU_RULE_PREFIX + "\n" + menu.menu_text]
-            rule_set.extend(menu.rules.split("\n"))
-            rule_set.extend(cafe.house_rules.split("\n"))
-            rule_set.extend(config.avatar_personality.split("\n"))
-            rule_set = list(filter(lambda x: len(x.strip()) > 0, rule_set))
-
             # Get avatar configurations
-            avatar_config: Dict = MenuHelper.parse_dict(cafe.avatar_settings) 
-            if 'voice' in avatar_config:
-                voice_id = avatar_config['voice']
-                del avatar_config['voice']
+            avatar_config: Dict = MenuHelper.parse_dict(cafe["avatar_settings"] or {})
+            if "voice" in avatar_config:
+                voice_id = avatar_config["voice"]
+                del avatar_config["voice"]
             else:
                 # Get the agent/avatar voice_id or fall back to system default.
                 voice_id = app_config.text_to_speech.default_voice_id
    
-            yak_agent = YakAgent(
+            # Agent construction loads model driver configs and tokenizers from disk.
+            yak_agent = await run_in_threadpool(
+                YakAgent,
                 business_uid=config.business_uid,
-                rules=rule_set,
+                rules=list(rule_set),
                 stream=config.stream,
                 voice_id=voice_id,
                 avatar_config=avatar_config
             )
 
-        agent_registry[config.session_id] = yak_agent
+        agent_registry.register(config.session_id, yak_agent)
         logger.info(
             f"Ok. Created agent for {config.business_uid}, menu_id {config.menu_id} with session_id {config.session_id}"
         )
@@ -218,36 +351,21 @@ def agent_create(config: SessionStart) -> Dict:
     return {"status": "success" if ok else "error", "msg": msg, "payload": ""}
 
 @app.get("/agent/get_avatar_config/{session_id}")
-def get_avatar_config(session_id: str)-> Union[Dict, None]:
+def get_avatar_config(
+    session_id: str, yak: YakAgent = Depends(require_yak)
+) -> Union[Dict, None]:
     """
     Avatar config is used for all non-voice related.
     """
     logger.info(f"Get avatar config : sesssion_id {session_id}")
-    msg: str = ""
-    ok: bool = True
-    ret: Any = None
+    ret: Any = yak.avatar_config
+    logger.debug(f"avatarConfig: {ret}")
 
-    # Retrieve the Agent (and agent memory) if session already underway
-    session_id: str = session_id
-    if session_id not in agent_registry:
-        msg = f"Error: Request for agent bound to session_id: {session_id} but none exists."
-        ok = False
-        logger.error(
-            msg
-        )
-        raise RuntimeError(
-            "No agent found. An agent must be created prior to starting chat."
-        )
-    
-    if ok:
-        yak: YakAgent = agent_registry[session_id]
-        ret = yak.avatar_config
-        logger.debug(f'avatarConfig: {ret}')
+    return StdResponse(True, "", ret)
 
-    return StdResponse(ok,msg, ret)
 
 @app.post("/chat_with_agent")
-def chat_with_agent(message: ApiUserMessage) -> Union[Any, Dict[str, str]]:
+async def chat_with_agent(message: ApiUserMessage) -> Union[Any, Dict[str, str]]:
     """
     Chat text_generation using griptape agent. Conversation memory is managed by Griptape so only the new question is passed in.
         Arguments:
@@ -265,24 +383,22 @@ def chat_with_agent(message: ApiUserMessage) -> Union[Any, Dict[str, str]]:
 
     # Retrieve the Agent (and agent memory) if session already underway
     session_id: str = message.session_id
-    if session_id not in agent_registry:
-        logger.error(
-            f"Error: Request for agent bound to session_id: {message.session_id} but none exists."
-        )
-        raise RuntimeError(
-            "No agent found. An agent must be created prior to starting chat."
-        )
-
-    yak: YakAgent = agent_registry[session_id]
+    yak: YakAgent = require_yak(session_id)
 
     if getattr(yak, "stream"):
         logger.debug(
             f"Request for text chat : sesssion_id {message.session_id} sending to streaming response to chat_with_agent "
         )
         response = Stream(yak.agent).run(message.user_input)
-        return StreamingResponse(my_gen(response), media_type="text/stream-event")
+        return StreamingResponse(
+            my_gen(response),
+            media_type="text/event-stream",
+            headers=_SSE_HEADERS,
+        )
     else:
-        response = yak.run(message.user_input).output.to_text()
+        response = (
+            await run_in_threadpool(yak.run, message.user_input)
+        ).output.to_text()
         logger.debug(
             f"Agent for sesssion_id {message.session_id} sending to NON-streaming response to chat_with_agent "
         )
@@ -300,35 +416,34 @@ def get_agent_to_say(message: ApiUserMessage) -> Dict:
     logger.info(f"Request for /get_agent_to_say : {message.user_input}")
     # Retrieve the Agent (and agent memory) if session already underway
     session_id: str = message.session_id
-    if session_id not in agent_registry:
-        logger.error(
-            f"Error: Request for agent bound to session_id: {session_id} but none exists."
-        )
-        raise RuntimeError(
-            "No agent found. An agent must be created prior to starting chat."
-        )
-
-    yak: YakAgent = agent_registry[session_id]
+    yak: YakAgent = require_yak(session_id)
 
-    TTS: AzureTextToSpeech = AzureTTSViseme(voice_id=yak.voice_id, audio_config=None)
+    TTS: AzureTextToSpeech = tts_pool.acquire(AzureTTSViseme, yak.voice_id)
 
-    def stream_generator(prompt):
-        stream, visemes = TTS.audio_viseme_generator(prompt)
-        yield MultiPartResponse(json.dumps(visemes), stream.audio_data).prepare()
+    async def stream_generator(prompt):
+        try:
+            stream, visemes = await run_in_threadpool(
+                TTS.audio_viseme_generator, prompt
+            )
+            yield MultiPartResponse(orjson.dumps(visemes), stream.audio_data).prepare()
+        finally:
+            tts_pool.release(TTS)
 
     logger.debug(f"Sending streaming response, session_id {session_id}")
     return StreamingResponse(
         stream_generator(message.user_input),
         media_type="multipart/x-mixed-replace; boundary=frame",
+        headers=_STREAMING_HEADERS,
     )
 
 
 @app.get("/get_last_response/{session_id}")
-def get_last_response(session_id: str) -> Dict[str, str]:
+def get_last_response(
+    session_id: str, yak: YakAgent = Depends(require_yak)
+) -> Dict[str, str]:
     """
     Get the complete last response generated by the agent.
     """
-    yak: YakAgent = agent_registry[session_id]
     last_response: str = ""
 
     try:
@@ -344,7 +459,7 @@ def get_last_response(session_id: str) -> Dict[str, str]:
 
 
 @app.post("/talk_with_agent")
-def talk_with_agent(message: ApiUserMessage) -> Dict:
+async def talk_with_agent(message: ApiUserMessage) -> Dict:
     """
     Get a synthesised voice for the stream LLM response and send that audio data back to the app.
     Does not generate Visemes for lipsync. See /talk_with_avatar for visemes.
@@ -354,33 +469,35 @@ def talk_with_agent(message: ApiUserMessage) -> Dict:
     logger.debug(f"User input: {message.user_input}")
 
     session_id: str = message.session_id
-    if session_id not in agent_registry:
-        logger.error(
-            f"Error: Request for agent bound to session_id: {message.session_id} but none exists."
-        )
-        raise RuntimeError(
-            "No agent found. An agent must be created prior to starting chat."
-        )
+    yak: YakAgent = require_yak(session_id)
 
-    yak: YakAgent = agent_registry[session_id]
-
-    TTS: AzureTextToSpeech = AzureTextToSpeech(voice_id=yak.voice_id, audio_config=None)
+    TTS: AzureTextToSpeech = await run_in_threadpool(
+        tts_pool.acquire, AzureTextToSpeech, yak.voice_id
+    )
     message_accumulator = []
     response = Stream(yak.agent).run(message.user_input)  # Streaming response.
-    yak.agent_status = YakStatus.TALKING
-
-    def stream_generator(response) -> Tuple[Any, str]:
-        for phrase in TTS.text_preprocessor(response, filter=None):
-            stream = TTS.audio_stream_generator(phrase)
-            yield MultiPartResponse(json.dumps(phrase), stream.audio_data).prepare()
-            if yak.status != YakStatus.TALKING:
-                # status can be changed by a call from client to the /interrupt_talking endpoint.
-                break
-        yak.status = YakStatus.IDLE
+    yak.status = YakStatus.TALKING
+
+    async def stream_generator(response) -> AsyncIterator[bytes]:
+        try:
+            async for phrase in iterate_in_thread(
+                TTS.text_preprocessor(response, filter=None)
+            ):
+                if not yak.is_talking:
+                    # status can be changed by a call from client to the /interrupt_talking endpoint.
+                    break
+                stream = await run_in_threadpool(TTS.audio_stream_generator, phrase)
+                yield MultiPartResponse(
+                    orjson.dumps(phrase), stream.audio_data
+                ).prepare()
+        finally:
+            tts_pool.release(TTS)
+            yak.status = YakStatus.IDLE
 
     return StreamingResponse(
         stream_generator(response),
         media_type="multipart/x-mixed-replace; boundary=frame",
+        headers=_STREAMING_HEADERS,
     )
 
 
@@ -394,35 +511,75 @@ async def talk_with_avatar(message: ApiUserMessage):
     logger.debug(f"User input: {message.user_input}")
 
     session_id: str = message.session_id
-    if session_id not in agent_registry:
-        logger.error(
-            f"Error: Request for agent bound to session_id: {message.session_id} but none exists."
-        )
-        raise RuntimeError(
-            "No agent found. An agent must be created prior to starting chat."
-        )
+    yak: YakAgent = require_yak(session_id)
 
-    yak: YakAgent = agent_registry[session_id]
-
-    TTS: AzureTextToSpeech = AzureTTSViseme(voice_id=yak.voice_id, audio_config=None)
+    TTS: AzureTextToSpeech = await run_in_threadpool(
+        tts_pool.acquire, AzureTTSViseme, yak.voice_id
+    )
 
     response = Stream(yak.agent).run(message.user_input)
 
-    def stream_generator(response) -> Tuple[Any, str]:
-        for phrase in TTS.text_preprocessor(response, filter=None):
-            stream, visemes = TTS.audio_viseme_generator(phrase)
-            yield MultiPartResponse(json.dumps(visemes), stream.audio_data).prepare()
-            if yak.status != YakStatus.TALKING:
-                # status can be changed by a call from client to the /interrupt_talking endpoint.
-                logger.debug(f"Exit stream due to status changed externally.")
-                break
-        yak.status = YakStatus.IDLE
-
-    yak.agent_status = YakStatus.TALKING
+    # Text generation, speech synthesis and delivery run concurrently, decoupled by queues.
+    phrase_queue: asyncio.Queue = asyncio.Queue(maxsize=8)
+    part_queue: asyncio.Queue = asyncio.Queue(maxsize=8)
+
+    async def phrase_producer(response) -> None:
+        """Split the streamed LLM response into phrases for synthesis."""
+        try:
+            async for phrase in iterate_in_thread(
+                TTS.text_preprocessor(response, filter=None)
+            ):
+                if not yak.is_talking:
+                    break
+                await phrase_queue.put(phrase)
+        except Exception as e:
+            logger.error(f"Error generating text for session_id {session_id}: {e}")
+        await phrase_queue.put(None)
+
+    async def speech_producer() -> None:
+        """Synthesise audio and visemes for each phrase and prepare the multipart frames."""
+        try:
+            while (phrase := await phrase_queue.get()) is not None:
+                if not yak.is_talking:
+                    break
+                stream, visemes = await run_in_threadpool(
+                    TTS.audio_viseme_generator, phrase
+                )
+                await part_queue.put(
+                    MultiPartResponse(
+                        orjson.dumps(visemes), stream.audio_data
+                    ).prepare()
+                )
+        except Exception as e:
+            logger.error(f"Error synthesising speech for session_id {session_id}: {e}")
+        await part_queue.put(None)
+
+    async def stream_generator(response) -> AsyncIterator[bytes]:
+        tasks = [
+            asyncio.create_task(phrase_producer(response)),
+            asyncio.create_task(speech_producer()),
+        ]
+        try:
+            while (part := await part_queue.get()) is not None:
+                yield part
+                if not yak.is_talking:
+                    # status can be changed by a call from client to the /interrupt_talking endpoint.
+                    logger.debug(f"Exit stream due to status changed externally.")
+                    break
+        finally:
+            for task in tasks:
+                task.cancel()
+            # Wait for any in-flight synthesis before the synthesizer is reused.
+            await asyncio.gather(*tasks, return_exceptions=True)
+            tts_pool.release(TTS)
+            yak.status = YakStatus.IDLE
+
+    yak.status = YakStatus.TALKING
 
     return StreamingResponse(
         stream_generator(response),
         media_type="multipart/x-mixed-replace; boundary=frame",
+        headers=_STREAMING_HEADERS,
     )
 
 
@@ -430,9 +587,9 @@ async def talk_with_avatar(message: ApiUserMessage):
 def agent_interrupt(session_id: str):
     """Change the agent_status. If set to IDLE, this will interrupt the speech generation in the talk_with_{agent|avatar} endpoints."""
     logger.info(f"Speech interupted: session_id {session_id}")
-    yak: YakAgent = agent_registry[session_id]
+    yak: YakAgent = agent_registry.get(session_id)
     if yak:
-        yak.agent_status = YakStatus.IDLE
+        yak.status = YakStatus.IDLE
     return StdResponse(True, "OK", "Interrupted")
 
 
@@ -445,13 +602,13 @@ Misc
 async def services_get_ai_prompts(businessUID: str) -> Dict:
     """Get ai prompts for text editing"""
 
-    prompts: List[str] = ServicesHelper.get_field_by_business_id(
+    prompts: List[str] = await ServicesHelper.get_field_by_business_id(
         database, business_uid=businessUID, field="prompts"
     )
     if prompts is not None:
         return {"status": "success", "msg": "", "payload": prompts}
     else:
-        prompts = ServicesHelper.get_field_by_business_id(
+        prompts = await ServicesHelper.get_field_by_business_id(
             database, business_uid=_DEFAULT_BUSINESS_UID, field="prompts"
         )
         if prompts is not None:
@@ -478,7 +635,9 @@ def service_agent(request: ServiceAgentRequest) -> Dict:
 
     if ok:
         if request.stream:
-            return StreamingResponse(response)
+            return StreamingResponse(
+                iterate_in_thread(response), headers=_STREAMING_HEADERS
+            )
         else:
             return {"status": "success", "msg": response}
     else:
@@ -496,7 +655,7 @@ async def upload_menu(
     file: UploadFile = File(...),
     grp_id: Optional[str] = Form(...),
 ):
-    """Save menu image to disk and add path to database. Returns the uuid of the menu and a collection_id for grouping multiple pages"""
+    """Save menu image to disk and add path to database. Returns the id of the menu and a collection_id for grouping multiple pages"""
 
     # TODO validate file.
     # Check if the file is a PNG image
@@ -512,35 +671,40 @@ async def upload_menu(
             detail="Invalid file extension. Only png,jpeg, jpg accepted.",
         )
 
-    file_id = str(uuid.uuid4())
+    file_id = sid()
     file_path = f"{app_config.assets.image_folder}/{file_id}{file_extension}"
 
-    # create thumbnail to avoid sending large files back to client
-    content = await file.read()
-    image_stream = io.BytesIO(content)
-    raw_image = Image.open(image_stream)
-    raw_image.save(file_path)
-    image_stream.seek(0)
-    AR = raw_image.width / raw_image.height
-    lower_res_size = (
-        math.floor(app_config.assets.thumbnail_image_width * AR),
-        app_config.assets.thumbnail_image_width,
-    )
-    lowres_image = raw_image.resize(lower_res_size, Image.LANCZOS)
     lowres_file_path = (
         f"{app_config.assets.image_folder}/{file_id}_lowres{file_extension}"
     )
-    lowres_image.save(lowres_file_path)
+
+    # Stream the upload to disk so memory use doesn't depend on the image size.
+    async with aiofiles.open(file_path, "wb") as fp:
+        while chunk := await file.read(_UPLOAD_CHUNK_SIZE):
+            await fp.write(chunk)
+
+    # create thumbnail to avoid sending large files back to client
+    try:
+        await run_in_threadpool(
+            make_thumbnail,
+            file_path,
+            lowres_file_path,
+            app_config.assets.thumbnail_image_width,
+        )
+    except Exception as e:
+        logger.error(f"Failed to create thumbnail for uploaded menu {file_id}: {e}")
+        Path(file_path).unlink(missing_ok=True)
+        raise HTTPException(status_code=400, detail="File is not a valid image.")
 
     # Create a Menu object with menu_id set to the file_id
     sequence_number: int = 0
     # Check for null-like values tha may occur when frontend passes non-initialized grp_id
     if grp_id is None or grp_id == "null" or grp_id == "":
         # This is a new collection so we need to create a collection id.
-        _grp_id = str(uuid.uuid4())
+        _grp_id = sid()
     else:
         _grp_id = grp_id
-        sequence_number = MenuHelper.count_menus_in_collection(
+        sequence_number = await MenuHelper.count_menus_in_collection(
             database, business_uid, grp_id
         )  # use as base-0 sequnce for images in the same collection
 
@@ -552,7 +716,7 @@ async def upload_menu(
     )
 
     # Create or update the cafe with the new menu
-    ok, msg = MenuHelper.save_menu(database, business_uid, new_menu)
+    ok, msg = await MenuHelper.save_menu(database, business_uid, new_menu)
 
     return {
         "status": "success" if ok else "erorr",
@@ -562,16 +726,17 @@ async def upload_menu(
 
 
 @app.get("/menus/collate_images/{business_uid}/{grp_id}")
-def menus_collate_images(business_uid: str, grp_id: str):
+async def menus_collate_images(business_uid: str, grp_id: str):
     """Collate the text from all the menu partial images belonging to the collection identified by grp_id"""
     ok = False
     msg: str = ""
     count: int = -1
     primary_menu_id: str = ""
 
-    ok, msg, count, primary_menu_id = MenuHelper.collate_text(
+    ok, msg, count, primary_menu_id = await MenuHelper.collate_text(
         database, business_uid, grp_id
     )
+    invalidate_rule_cache(business_uid)
     if ok:
         logger.info(f"Collated text from {count} images into menu_id {primary_menu_id}")
     else:
@@ -588,7 +753,7 @@ def menus_collate_images(business_uid: str, grp_id: str):
 
 @app.get("/menus/get_one/{business_uid}/{menu_id}")
 async def menus_get_one(business_uid: str, menu_id: str):
-    menu: Menu = MenuHelper.get_one_menu(database, business_uid, menu_id)
+    menu: Menu = await MenuHelper.get_one_menu(database, business_uid, menu_id)
     # if menu is not None:
     #    menu = Helper.insert_images(config, menu)
     return {
@@ -599,9 +764,15 @@ async def menus_get_one(business_uid: str, menu_id: str):
 
 
 @app.get("/menus/get_all/{business_uid}")
-async def menus_get_all(business_uid: str, for_display: bool = True):
-    """Get all the menus"""
-    menus: List[Menu] = MenuHelper.get_menu_list(database, business_uid)
+async def menus_get_all(
+    business_uid: str, for_display: bool = True, inline_thumbnails: bool = False
+):
+    """
+    Get all the menus.
+    Thumbnails are served from the static MENU_IMAGE_ROUTE (see menu.thumbnail_url) unless inline_thumbnails is set,
+    in which case the base64 encoded image is included in menu.thumbnail_image_data.
+    """
+    menus: List[Menu] = await MenuHelper.get_menu_list(database, business_uid)
     if len(menus) == 0:
         # It might just be that there are none.
         return {
@@ -609,32 +780,34 @@ async def menus_get_all(business_uid: str, for_display: bool = True):
             "message": f"Failed getting menu list for business {business_uid}",
             "menus": [],
         }
-    else:
+    elif inline_thumbnails:
         # Insert thumbnail image data into the menu records before sending to client.
-        loaded_menus = MenuHelper.insert_images(
+        loaded_menus = await MenuHelper.insert_images(
             app_config, menus=menus, image_types=[ImageSelector.THUMBNAIL]
         )
         if loaded_menus is None:
             return {"status": "Warning", "message": "No thumbnail menus returned."}
-
-    return {
-        "status": "success",
-        "message": "",
-        "menus": [menu.to_dict() for menu in loaded_menus],
-    }
+    else:
+        loaded_menus = menus
+
+    # Serialize directly. The menu list can be large and doesn't need to go through jsonable_encoder.
+    # Menus are dataclasses which orjson serializes natively without building intermediate dicts.
+    return Response(
+        content=orjson.dumps(
+            {"status": "success", "message": "", "menus": loaded_menus}
+        ),
+        media_type="application/json",
+    )
 
 
 @app.get("/menus/get_as_options/{business_uid}/{encoded_utc_time}")
-def menus_get_as_options(business_uid: str, encoded_utc_time: str):
+async def menus_get_as_options(business_uid: str, encoded_utc_time: str):
     """Get all menus and choose a default based on the menu time of day validity and the passed in time.
     Note:
         All dates in Yak are stored as UTC time. Conversion to local time is consumer responsibility
         encoded_utc_time may not contain the postfix Z but it wall alwasy be assumed to be in UTC time.
     """
 
-    menus: List[Menu] = MenuHelper.get_menu_list(
-        database, business_uid, for_display=True
-    )
     decoded_utc_time: str = urllib.parse.unquote(encoded_utc_time).rstrip(
         "Z"
     )  # Drop the ISO 8601 explict maker for UTC time.
@@ -643,29 +816,16 @@ def menus_get_as_options(business_uid: str, encoded_utc_time: str):
     options: List[Dict[str, str]] = []
     msg: str = ""
 
+    # Validity of each menu at utc_time is evaluated by the database.
+    menus: List[Dict] = await MenuHelper.get_menu_options(
+        database, business_uid, utc_time.hour * 60 + utc_time.minute
+    )
+
     if len(menus) > 0:  # Get the first valid one and make it the default.
         for menu in menus:
-            options.append({"label": menu.name, "value": menu.menu_id})
-            if "start" in menu.valid_time_range and "end" in menu.valid_time_range:
-                # Check if time of day falls within the valid time range.
-                if (
-                    menu.valid_time_range["start"].date()
-                    != menu.valid_time_range["end"]
-                ):
-                    # time range straddles 2 different days.
-                    if (
-                        utc_time.time() <= menu.valid_time_range["end"].time()
-                        or utc_time.time() >= menu.valid_time_range["start"].time()
-                    ):
-                        default_menu_id = menu.menu_id
-                        break
-                else:  # same day
-                    if (
-                        utc_time.time() <= menu.valid_time_range["end"].time()
-                        and utc_time.time() >= menu.valid_time_range["start"].time()
-                    ):
-                        default_menu_id = menu.menu_id
-                        break
+            options.append({"label": menu["name"], "value": menu["menu_id"]})
+            if default_menu_id == "" and menu["is_valid"]:
+                default_menu_id = menu["menu_id"]
     else:
         msg = "No menus returned."
         logger.warning(f"No menus found for business_uid = {business_uid}")
@@ -678,15 +838,33 @@ def menus_get_as_options(business_uid: str, encoded_utc_time: str):
 
 
 @app.put("/menus/update_one/{business_uid}/{menu_id}")
-async def menus_update_one(business_uid: str, menu_id: str, menu: Menu):
-    """Update one menu in the cafe.menus. Menu contains optional fields, which, when absent leave the stored menu field unchanged."""
-    ok, msg = MenuHelper.update_menu(database, business_uid, menu)
+async def menus_update_one(business_uid: str, menu_id: str, menu: Dict[str, Any]):
+    """Update one menu in the cafe.menus. menu is a partial Menu. Fields that are absent leave the stored menu field unchanged."""
+    ok, msg = await MenuHelper.update_menu(database, business_uid, menu_id, menu)
+    invalidate_rule_cache(business_uid)
     return {"status": "success" if ok == True else "error", "message": msg}
 
 
+@app.put("/menus/update_fields/{business_uid}")
+async def menus_update_fields(business_uid: str, updates: List[MenuFieldUpdate]):
+    """Set individual fields on several menus of the cafe in one database round trip."""
+    ok, msg, count = await MenuHelper.bulk_update_menu_fields(
+        database,
+        business_uid,
+        [(update.menu_id, update.field, update.value) for update in updates],
+    )
+    invalidate_rule_cache(business_uid)
+    return {
+        "status": "success" if ok == True else "error",
+        "message": msg,
+        "payload": {"count": count},
+    }
+
+
 @app.get("/menus/delete_one/{business_uid}/{menu_id}")
 async def menus_delete_one(business_uid: str, menu_id: str):
-    ok, msg = MenuHelper.delete_one_menu(database, business_uid, menu_id)
+    ok, msg = await MenuHelper.delete_one_menu(database, business_uid, menu_id)
+    invalidate_rule_cache(business_uid)
     return {"status": "success" if ok == True else "error", "message": msg}
 
 
@@ -696,6 +874,7 @@ async def menu_ocr(business_uid: str, menu_id: str):
 
     ret = None
     status: bool = False
+    msg: str = ""
     url: str = app_config.ocr.url
     data = {
         "options": json.dumps(
@@ -706,33 +885,37 @@ async def menu_ocr(business_uid: str, menu_id: str):
         )
     }
     # Need the file extension
-    menu: Menu = MenuHelper.get_one_menu(
+    menu: Menu = await MenuHelper.get_one_menu(
         database, business_uid=business_uid, menu_id=menu_id
     )
-    file_path = f"{app_config.assets.image_folder}/{menu_id}.png"
+    if menu is None:
+        msg = f"menu {menu_id} not found for business {business_uid}"
+        logger.error(f"Error in performing OCR. Message {msg}")
+        return {"status": "error", "message": msg}
+    file_path = f"{app_config.assets.image_folder}/{menu.raw_image_rel_path}"
 
     try:
-        # Tesseract requires the file object to be passed in not the URL.
-        with open(file_path, "rb") as fp:
-            files = {"file": fp}
-            response = requests.post(url, data=data, files=files)
-            if response.ok:
-                ret = json.loads(response.text)
-                if (
-                    "stdout" in ret["data"]
-                ):  # contains messages. OCR text in response.content.stdout
-                    # Save it to db
-                    status, msg = MenuHelper.update_menu_field(
-                        database,
-                        business_uid,
-                        menu_id,
-                        ret["data"]["stdout"],
-                        "menu_text",
-                    )
-                else:
-                    logger.error(
-                        f'menu_ocr has not field "stdout" business {business_uid}: err {msg}'
-                    )
+        # Tesseract requires the file itself to be passed in not the URL. Stream it from disk rather than reading it into memory.
+        headers, body = multipart_file_upload(file_path, "file", data)
+        response = await http_client.post(url, content=body, headers=headers)
+        if response.is_success:
+            ret = orjson.loads(response.content)
+            if (
+                "stdout" in ret["data"]
+            ):  # contains messages. OCR text in response.content.stdout
+                # Save it to db
+                status, msg = await MenuHelper.update_menu_field(
+                    database,
+                    business_uid,
+                    menu_id,
+                    ret["data"]["stdout"],
+                    "menu_text",
+                )
+                invalidate_rule_cache(business_uid)
+            else:
+                logger.error(
+                    f'menu_ocr has not field "stdout" business {business_uid}: err {msg}'
+                )
     except Exception as e:
         msg = e
         logger.error(f"Error in performing OCR. Message {e}")
@@ -746,8 +929,10 @@ Business entities
 
 
 @app.get("/cafe/settings/get/{business_uid}")
-def get_settings(business_uid: str):
-    cafe = MenuHelper.get_cafe(database, business_uid=business_uid)
+async def get_settings(business_uid: str):
+    cafe = await MenuHelper.get_cafe(
+        database, business_uid=business_uid, projection={"menus": 0}
+    )
     if cafe is not None:
         cafe.menus = []  # Not needed but must NOT be None
         return StdResponse(True, "", cafe.to_dict()).to_dict()
@@ -756,24 +941,27 @@ def get_settings(business_uid: str):
 
 
 @app.post("/cafe/settings/save")
-def cafe_save_settings(settings: Cafe):
+async def cafe_save_settings(settings: Cafe):
     ok: bool = False
     msg: str = ""
     ret = None
 
-    ok, msg = MenuHelper.upsert_cafe_settings(database, settings.business_uid, settings)
+    ok, msg = await MenuHelper.upsert_cafe_settings(
+        database, settings.business_uid, settings
+    )
+    invalidate_rule_cache(settings.business_uid)
 
     return StdResponse(ok, msg).to_dict()
 
 
 @app.get("/data/options/{business_uid}/{table_name}/{columns}")
-def cafe_get_setting_options(business_uid: str, table_name: str, columns: str):
+async def cafe_get_setting_options(business_uid: str, table_name: str, columns: str):
     ok: bool = False
     msg: str = ""
     ret = None
     return_fields: str = columns.split(",")
 
-    data: List[Dict] = DataHelper.get_non_business_data(
+    data: List[Dict] = await DataHelper.get_non_business_data(
         database, table_name=f"{table_name}", return_field_names=return_fields
     )
     if data is not None:
@@ -797,6 +985,12 @@ if __name__ == "__main__":
 
     app_config = OmegaConf.load(args.config_path)
 
+    app.mount(
+        MENU_IMAGE_ROUTE,
+        CachedStaticFiles(directory=app_config.assets.image_folder),
+        name="menu-img",
+    )
+
     # Instantiate Mongo class that provides API for pymongo interaction with mongodb.
     database = DatabaseConfig(app_config)
 
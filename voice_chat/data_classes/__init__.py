@@ -2,7 +2,7 @@ from .chat_data_classes import ApiUserMessage
 from .chat_data_classes import AppParameters
 from .chat_data_classes import ModelDriverConfiguration
 from .chat_data_classes import RuleList
-from .mongodb_helper import MenuHelper, DatabaseConfig, ServicesHelper
+from .mongodb_helper import MenuHelper, DatabaseConfig, ServicesHelper, DataHelper
 
 __all__ = [
     "ApiUserMessage",
@@ -11,5 +11,6 @@ __all__ = [
     "RuleList",
     "MenuHelper",
     "DatabaseConfig",
-    "ServiceHelper",
+    "ServicesHelper",
+    "DataHelper",
 ]
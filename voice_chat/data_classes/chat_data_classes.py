@@ -1,4 +1,5 @@
-from typing import Optional, Dict, Union, List, Any
+from typing import Optional, Dict, Union, List, Any, Tuple
+from functools import lru_cache
 from os import PathLike
 from pydantic import BaseModel
 from dataclasses import dataclass
@@ -64,6 +65,14 @@ class ServiceAgentRequest(BaseModel):
     stream: bool
 
 
+class MenuFieldUpdate(BaseModel):
+    """Set menu.field = value for one menu. Sent in batches to update several menus at once."""
+
+    menu_id: str
+    field: str
+    value: Any
+
+
 @define
 class ModelDriverConfiguration:
     """
@@ -237,16 +246,40 @@ class StdResponse:
         return json.dumps(res)
 
 
+@lru_cache(maxsize=8)
+def _multipart_headers(boundary: str) -> Tuple[bytes, bytes]:
+    """Part headers for the json and audio parts of a MultiPartResponse. These are the same for every frame."""
+    return (
+        f"--{boundary}\r\nContent-Type: application/json\r\n\r\n".encode(),
+        f"\r\n--{boundary}\r\nContent-Type: audio/mpeg\r\n\r\n".encode(),
+    )
+
+
 @dataclass
 class MultiPartResponse:
     """Use for sending metadata and audio"""
 
-    json_data: str
+    json_data: Union[str, bytes]
     audio_bytes: bytes
     boundary: str = "frame"  # BOundery marker for multipart mixed type response for fastAPI endpoints
 
-    def prepare(self) -> str:
+    def prepare(self) -> bytes:
         """
-        return string with boundary markers and data.
+        return bytes with boundary markers and data. Each part is opened with the boundary delimiter and closed with CRLF.
+        The audio is base64 encoded.
         """
-        return f"--{self.boundary}\r\nContent-Type: application/json\r\n\r\n{self.json_data}\r\n{self.boundary}--frame\r\nContent-Type: audio/mpeg\r\n\r\n {base64.b64encode(self.audio_bytes).decode('utf-8')}"
+        json_header, audio_header = _multipart_headers(self.boundary)
+        json_data = (
+            self.json_data
+            if isinstance(self.json_data, bytes)
+            else self.json_data.encode()
+        )
+        return b"".join(
+            (
+                json_header,
+                json_data,
+                audio_header,
+                base64.b64encode(self.audio_bytes),
+                b"\r\n",
+            )
+        )
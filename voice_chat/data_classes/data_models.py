@@ -1,17 +1,20 @@
 from typing import List, Dict, Union, Tuple, Any, Optional
 from datetime import datetime, timezone
-from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
 from uuid import uuid4
 import logging
 import os
 from pydantic import BaseModel, validator
 from pydantic.dataclasses import dataclass
 from dataclasses import field  # pydantic.dataclasses doesn't ahve a field method
+import dataclasses
+import copy
+from functools import lru_cache
 from enum import Enum
 
 logger = logging.getLogger(__name__)
 
+MENU_IMAGE_ROUTE = "/menu-img"  # Route on which the api serves the menu image folder.
+
 """
 Pydantic.dataclasses - Data models for DB - thses classes are not database specific
 Note images are stored outside the database and the data is inserted JIT as needed.
@@ -19,6 +22,35 @@ Note images are stored outside the database and the data is inserted JIT as need
 """
 
 
+@lru_cache(maxsize=None)
+def _field_defaults(cls) -> Tuple[Tuple[str, Any, Any], ...]:
+    """(name, default, default_factory) of each field of a dataclass, in declaration order."""
+    return tuple(
+        (_field.name, _field.default, _field.default_factory)
+        for _field in dataclasses.fields(cls)
+    )
+
+
+def _construct(cls, values: Dict) -> Any:
+    """
+    Create a pydantic dataclass instance without validation (cf. pydantic's model_construct which dataclasses lack).
+    Only use for trusted data e.g. documents read back from the database. Keys that aren't fields are ignored and missing fields take their defaults.
+    """
+    fields: Dict = {}
+    for name, default, factory in _field_defaults(cls):
+        if name in values:
+            fields[name] = values[name]
+        elif default is not dataclasses.MISSING:
+            fields[name] = default
+        else:
+            fields[name] = factory()
+    obj = cls.__new__(cls)
+    obj.__dict__.update(fields)
+    if hasattr(obj, "__post_init__"):
+        obj.__post_init__()
+    return obj
+
+
 class ImageSelector(Enum):
     RAW = 0
     THUMBNAIL = 1
@@ -46,6 +78,12 @@ class Menu:
     menu_text: str = ""
     valid_time_range: Dict[str, Optional[datetime]] = field(default_factory=dict)
     rules: str = ""
+    # Derived from thumbnail_image_rel_path. Not stored.
+    thumbnail_url: Optional[str] = ""
+
+    def __post_init__(self):
+        if self.thumbnail_image_rel_path:
+            self.thumbnail_url = f"{MENU_IMAGE_ROUTE}/{self.thumbnail_image_rel_path}"
 
     @validator("valid_time_range", pre=True, each_item=True)
     def set_utc_timezone(cls, v):
@@ -54,6 +92,15 @@ class Menu:
             return v.replace(tzinfo=timezone.utc)
         return v
 
+    def valid_minutes_utc(self, key: str) -> Optional[int]:
+        """Minute of the day (UTC) of valid_time_range[key]. Stored alongside the menu so that validity can be queried in the database."""
+        value = self.valid_time_range.get(key)
+        if not isinstance(value, datetime):
+            return None
+        if value.tzinfo is not None:
+            value = value.astimezone(timezone.utc)
+        return value.hour * 60 + value.minute
+
     def to_dict(self):
         # Convert Menu instance to dictionary
         return {
@@ -68,14 +115,26 @@ class Menu:
             "ocr_image_data": self.ocr_image_data,
             "menu_text": self.menu_text,
             "valid_time_range": self.valid_time_range,
+            "valid_minutes_start_utc": self.valid_minutes_utc("start"),
+            "valid_minutes_end_utc": self.valid_minutes_utc("end"),
             "rules": self.rules,
         }
 
+    @classmethod
+    def from_db(cls, data: Dict):
+        """Create Menu instance from a database document without validation. Containers are copied so that the document can be cached."""
+        values: Dict = dict(data)
+        for key in ("collection", "valid_time_range"):
+            value = data.get(key, {})
+            # Only real dicts are copied. Both fields may be stored as None.
+            values[key] = dict(value) if isinstance(value, dict) else value
+        return _construct(cls, values)
+
     @classmethod
     def from_dict(cls, data):
         # Create Menu instance from dictionary
         return cls(
-            menu_id=data.get("menu_id"),
+            menu_id=data.get("menu_id", ""),
             collection=data.get("collection", {}),
             name=data.get("name", ""),
             raw_image_rel_path=data.get("raw_image_rel_path", ""),
@@ -118,6 +177,16 @@ class Cafe:
             "model": self.model,
         }
 
+    @classmethod
+    def from_db(cls, data: Dict):
+        """Create Cafe instance from a trusted database document without validation. See Menu.from_db"""
+        values: Dict = dict(data)
+        values["avatar_settings"] = copy.deepcopy(data.get("avatar_settings", {}))
+        values["menus"] = [
+            Menu.from_db(menu_data) for menu_data in data.get("menus", [])
+        ]
+        return _construct(cls, values)
+
     @classmethod
     def from_dict(cls, data: Dict):
         """Create Cafe instance from dictionary"""
@@ -129,5 +198,5 @@ class Cafe:
             house_rules=data.get("house_rules", ""),
             menus=[Menu.from_dict(menu_data) for menu_data in data.get("menus", [])],
             notes=data.get("notes", ""),
-            model=data.get("model"),
+            model=data.get("model", "none"),
         )
@@ -1,7 +1,8 @@
 from typing import List, Dict, Union, Tuple, Any
 import datetime
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo import MongoClient
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import ConnectionFailure, PyMongoError
 from uuid import uuid4
 import logging
 import os
@@ -12,7 +13,11 @@ from dataclasses import field  # pydantic.dataclasses doesn't ahve a field metho
 from omegaconf import OmegaConf
 import base64
 from itertools import chain
-import json
+import orjson
+import asyncio
+import copy
+import threading
+from cachetools import TTLCache, LRUCache
 
 from voice_chat.data_classes.data_models import Menu, Cafe, ImageSelector
 
@@ -22,18 +27,226 @@ logger = logging.getLogger(__name__)
     All classes related to MongoDB and pymongo.
 """
 
+"""
+    In-process caches for slowly changing documents. Cafe documents are cached raw (as returned by pymongo)
+    and deserialized per call so that callers are free to mutate the returned objects.
+    Writes through the helpers below invalidate the cache for the business. The ttl bounds how stale a read can be
+    after a write from another process and is set from config.database.cache_ttl_seconds.
+"""
+_CACHE_TTL_SECONDS: int = 60
+_CACHE_MAX_SIZE: int = 1024
+_cafe_cache: TTLCache = TTLCache(
+    maxsize=_CACHE_MAX_SIZE, ttl=_CACHE_TTL_SECONDS
+)  # (business_uid, projection key) -> cafe document
+_services_cache: TTLCache = TTLCache(
+    maxsize=_CACHE_MAX_SIZE, ttl=_CACHE_TTL_SECONDS
+)  # (business_uid, field, flatten) -> field values
+_cache_lock = threading.RLock()
+# business_uid -> count of invalidations. A read only caches its result if no write invalidated the business while it was in flight.
+_cafe_generations: Dict[str, int] = {}
+
+
+def _configure_caches(ttl: float) -> None:
+    """Replace the document caches with empty caches using the given ttl in seconds."""
+    global _cafe_cache, _services_cache
+    with _cache_lock:
+        _cafe_cache = TTLCache(maxsize=_CACHE_MAX_SIZE, ttl=ttl)
+        _services_cache = TTLCache(maxsize=_CACHE_MAX_SIZE, ttl=ttl)
+
+
+# Base64 image data is (re)inserted from disk by insert_images so it never needs to be read from the database.
+_NO_IMAGE_DATA: Dict = {
+    "menus.raw_image_data": 0,
+    "menus.thumbnail_image_data": 0,
+    "menus.ocr_image_data": 0,
+}
+
+
+# Fields never written by update_menu. Image data is inserted from disk when menus are read so isn't stored.
+_MENU_UPDATE_SKIP_FIELDS: frozenset = frozenset(
+    ("menu_id", "raw_image_data", "thumbnail_image_data", "ocr_image_data")
+)
+# Derived from valid_time_range so always written to stay consistent with it, even when None.
+_MENU_DERIVED_FIELDS: frozenset = frozenset(
+    ("valid_minutes_start_utc", "valid_minutes_end_utc")
+)
+
+
+# Fields menu updates never set. thumbnail_url is derived so is never stored.
+_MENU_FIELD_UPDATE_REJECTED: frozenset = _MENU_UPDATE_SKIP_FIELDS | {"thumbnail_url"}
+
+
+def _menu_field_set(field: str, value: Any) -> Dict:
+    """
+    $set, using the positional operator, of a single field of a matched menu.
+    The value is validated as a Menu would. valid_time_range is written along with the valid minutes derived from it.
+
+    @raises:
+        ValueError: if the field doesn't exist, can't be updated this way or the value isn't valid.
+    """
+    if field not in Menu.__dataclass_fields__ or field in _MENU_FIELD_UPDATE_REJECTED:
+        raise ValueError(f"Menu field {field} doesn't exist or can't be updated")
+    menu_dict: Dict = Menu(**{field: value}).to_dict()
+    keys: Tuple = (
+        (field, *_MENU_DERIVED_FIELDS) if field == "valid_time_range" else (field,)
+    )
+    return {f"menus.$.{key}": menu_dict[key] for key in keys}
+
+
+# ImageSelector -> (Menu attribute with the image path, Menu attribute for the base64 image data)
+_IMAGE_ATTRIBUTES: Dict[ImageSelector, Tuple[str, str]] = {
+    ImageSelector.RAW: ("raw_image_rel_path", "raw_image_data"),
+    ImageSelector.OCR: ("ocr_image_rel_path", "ocr_image_data"),
+    ImageSelector.THUMBNAIL: ("thumbnail_image_rel_path", "thumbnail_image_data"),
+}
+
+
+def _projection_key(projection: Dict) -> Tuple:
+    """Hashable cache key for a projection. None for the full document."""
+    return tuple(sorted(projection.items())) if projection else None
+
+
+def _cached_cafe(business_uid: str) -> Dict:
+    """
+    Cached cafe document with every field except (possibly) the image data, or None.
+    get_menu_list caches the _NO_IMAGE_DATA projection so that entry serves the menu and agent lookups too.
+    """
+    with _cache_lock:
+        return _cafe_cache.get((business_uid, None)) or _cafe_cache.get(
+            (business_uid, _projection_key(_NO_IMAGE_DATA))
+        )
+
+
+"""
+    Concurrent get_cafe reads (e.g. many clients of the same or different cafes) that arrive within the same
+    event loop iteration are coalesced into a single find with $in.
+"""
+# projection key -> (projection, {business_uid: future}, flush task)
+_pending_cafe_reads: Dict[
+    Tuple, Tuple[Dict, Dict[str, asyncio.Future], asyncio.Task]
+] = {}
+
+
+async def _read_cafe_batched(
+    db: "DatabaseConfig", business_uid: str, projection: Dict = None
+) -> Dict:
+    """Equivalent to db.cafes.find_one({"business_uid": business_uid}, projection) but batched with other pending reads."""
+    loop = asyncio.get_running_loop()
+    key: Tuple = _projection_key(projection)
+    batch = _pending_cafe_reads.get(key)
+    if batch is None:
+        batch = (projection, {}, loop.create_task(_flush_cafe_reads(db, key)))
+        _pending_cafe_reads[key] = batch
+    future: asyncio.Future = batch[1].get(business_uid)
+    if future is None:
+        future = loop.create_future()
+        batch[1][business_uid] = future
+    # Shielded as the future is shared by all requests for the business.
+    return await asyncio.shield(future)
+
+
+async def _flush_cafe_reads(db: "DatabaseConfig", key: Tuple) -> None:
+    projection, futures, _ = _pending_cafe_reads.pop(key)
+    if projection and any(projection.values()):
+        projection = projection | {
+            "business_uid": 1
+        }  # Needed to match documents to requests.
+    try:
+        docs: Dict[str, Dict] = {}
+        async for doc in db.cafes.find(
+            {"business_uid": {"$in": list(futures.keys())}}, projection
+        ):
+            docs.setdefault(doc["business_uid"], doc)
+        for business_uid, future in futures.items():
+            if not future.done():
+                future.set_result(docs.get(business_uid))
+    except Exception as e:
+        for future in futures.values():
+            if not future.done():
+                future.set_exception(e)
+
+
+# Must be a multiple of 3 so that no chunk but the last is padded.
+_B64_CHUNK_SIZE: int = 96 * 1024
+
+
+def _b64_stream(path: str, chunk: int = _B64_CHUNK_SIZE) -> bytearray:
+    """Base64 encode a file a chunk at a time so that the whole raw file is never held in memory alongside its encoding."""
+    buf = bytearray()
+    with open(path, "rb") as image_file:
+        while data := image_file.read(chunk):
+            buf += base64.b64encode(data)
+    return buf
+
+
+# Image files only change on upload so their encodings are cached. Keyed on mtime and size so a replaced file is re-encoded.
+_B64_CACHE_MAX_BYTES: int = 64 * 1024 * 1024
+# (path, st_mtime_ns, st_size) -> base64 str. Bounded by the total size of the cached strings.
+_b64_cache: LRUCache = LRUCache(maxsize=_B64_CACHE_MAX_BYTES, getsizeof=len)
+
+
+def _b64_file(path: str) -> str:
+    """Base64 encoded contents of the file, from cache if the file hasn't changed."""
+    stat = os.stat(path)
+    key: Tuple = (path, stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        encoded: str = _b64_cache.get(key)
+    if encoded is None:
+        encoded = _b64_stream(path).decode("ascii")
+        try:
+            with _cache_lock:
+                _b64_cache[key] = encoded
+        except ValueError:
+            pass  # Larger than the whole cache.
+    return encoded
+
 
 class DatabaseConfig:
     """Database connection for MongoDB"""
 
     def __init__(self, config: Dict):
-        self.client = MongoClient(
-            f"mongodb://{os.environ['MONGO_INITDB_ROOT_USERNAME']}:{os.environ['MONGO_INITDB_ROOT_PASSWORD']}@{config.database.url}"
+        # A single client is shared by all requests. It owns the connection pool.
+        self.client = AsyncIOMotorClient(
+            f"mongodb://{os.environ['MONGO_INITDB_ROOT_USERNAME']}:{os.environ['MONGO_INITDB_ROOT_PASSWORD']}@{config.database.url}",
+            maxPoolSize=config.database.get("max_pool_size", 50),
+            minPoolSize=config.database.get("min_pool_size", 5),
+            maxIdleTimeMS=config.database.get("max_idle_time_ms", 30000),
+            waitQueueTimeoutMS=config.database.get("wait_queue_timeout_ms", 5000),
+            serverSelectionTimeoutMS=config.database.get(
+                "server_selection_timeout_ms", 2000
+            ),
+            # Return datetimes as UTC aware, as the Menu validator would, so documents can be used without validation.
+            tz_aware=True,
         )
         self.db = self.client[config.database.name]
         self.cafes = self.db[config.database.default_collection]
         self.services = self.db[config.database.services_collection]
         self.data = self.db[config.database.data_collection]
+        _configure_caches(config.database.get("cache_ttl_seconds", _CACHE_TTL_SECONDS))
+
+    async def ensure_indexes(self) -> None:
+        """
+        Create the indexes used by the helper queries. Safe to call repeatedly.
+        Failures are logged rather than raised so that the API still starts if the database is unavailable.
+        """
+        indexes: List[Tuple] = [
+            (self.cafes, [("business_uid", 1), ("menus.menu_id", 1)], {}),
+            (self.cafes, [("business_uid", 1), ("menus.collection.grp_id", 1)], {}),
+            (self.services, [("business_uid", 1)], {}),
+            # Existing duplicate cafes must be merged by hand before the constraint can be added.
+            (self.cafes, [("business_uid", 1)], {"unique": True}),
+        ]
+        for collection, keys, options in indexes:
+            try:
+                await collection.create_index(keys, **options)
+            except ConnectionFailure as e:
+                # Don't wait out the server selection timeout again for every index.
+                logger.error(f"Indexes not created, database unavailable: {e}")
+                return
+            except PyMongoError as e:
+                logger.error(
+                    f"Index {keys} {options} on {collection.name} not created: {e}"
+                )
 
 
 class DataHelper:
@@ -45,7 +258,7 @@ class DataHelper:
         pass
 
     @classmethod
-    def get_non_business_data(
+    async def get_non_business_data(
         cls,
         config: DatabaseConfig,
         *,
@@ -55,16 +268,10 @@ class DataHelper:
         # sort_field_name: str  # can't be a dictionary field name.
     ):
         """Get a list of str fields for given table."""
-        selector: Dict = {}
-        if config.data.find({"table_name": {"$exists": True}}):
-            for field_name in return_field_names:
-                config.data.find({f"{field_name}": {"$exists": True}})
-                selector[f"{field_name}"] = True
-            selector["_id"] = False  # drop it because its not seriaizable
-        else:
-            return None
-        results = config.data.find({"table_name": table_name}, selector)
-        return results
+        selector: Dict = {field_name: True for field_name in return_field_names}
+        selector["_id"] = False  # drop it because its not seriaizable
+        cursor = config.data.find({"table_name": table_name}, selector).batch_size(500)
+        return await cursor.to_list(length=None)
 
 
 class ServicesHelper:
@@ -77,7 +284,7 @@ class ServicesHelper:
         pass
 
     @classmethod
-    def get_field_by_business_id(
+    async def get_field_by_business_id(
         cls,
         config: DatabaseConfig,
         *,
@@ -98,14 +305,22 @@ class ServicesHelper:
             return None
 
         if business_uid and isinstance(business_uid, str):
+            cache_key = (business_uid, field, flatten)
+            with _cache_lock:
+                ret: Any = _services_cache.get(cache_key)
+            if ret is not None:
+                return list(ret)
+
             results = config.services.find({"business_uid": business_uid})
             if results is not None and isinstance(results, Dict):
                 return results[field]
             else:
-                ret: Any = [result[field] for result in results]
+                ret = [result[field] async for result in results]
                 if flatten:
                     ret = list(chain.from_iterable(ret))
-                return ret
+                with _cache_lock:
+                    _services_cache[cache_key] = ret
+                return list(ret)
 
 
 class MenuHelper:
@@ -113,106 +328,143 @@ class MenuHelper:
         pass
 
     @classmethod
-    def insert_images(
+    async def insert_images(
         cls,
         config: OmegaConf,
         menus: Union[Menu, List[Menu]],
         image_types: List[ImageSelector],
     ) -> Union[Menu, List[Menu]]:
-        """Images are stored on disk outside the database. This functions add the images as base64, uts-8 encoded strings to the menu."""
-        ret = None
-        if isinstance(menus, Menu):
-            _menus = [menus]
-        else:
-            _menus = menus
+        """
+        Images are stored on disk outside the database. This functions add the images as base64, uts-8 encoded strings to the menu.
+        The files are read and encoded concurrently in worker threads.
+        """
+        single: bool = isinstance(menus, Menu)
+        _menus: List[Menu] = [menus] if single else menus
+        jobs: List[Tuple[Menu, str, str]] = []  # (menu, data attribute, image path)
         for menu in _menus:
             for image_type in image_types:
-                try:
-                    if image_type == ImageSelector.RAW:
-                        if menu.raw_image_rel_path != "":
-                            with open(
-                                f"{config.assets.image_folder}/{menu.raw_image_rel_path}",
-                                "rb",
-                            ) as image_file:
-                                menu.raw_image_data = base64.b64encode(
-                                    image_file.read()
-                                ).decode("utf-8")
-                    elif image_type == ImageSelector.OCR:
-                        if menu.ocr_image_rel_path:
-                            with open(
-                                f"{config.assets.image_folder}/{menu.ocr_image_rel_path}",
-                                "rb",
-                            ) as image_file:
-                                menu.raw_image_data = base64.b64encode(
-                                    image_file.read()
-                                ).decode("utf-8")
-                    elif image_type == ImageSelector.THUMBNAIL:
-                        if menu.thumbnail_image_rel_path:
-                            with open(
-                                f"{config.assets.image_folder}/{menu.thumbnail_image_rel_path}",
-                                "rb",
-                            ) as image_file:
-                                menu.thumbnail_image_data = base64.b64encode(
-                                    image_file.read()
-                                ).decode("utf-8")
-                except Exception as e:
-                    logger.error("Failed to insert images into menu object: {e}")
-
-                if isinstance(menus, Menu):
-                    """If only a single Menu was passed in then return a Menu object"""
-                    ret = _menus[0]
-                else:
-                    ret = _menus
+                rel_path_attribute, data_attribute = _IMAGE_ATTRIBUTES[image_type]
+                rel_path: str = getattr(menu, rel_path_attribute)
+                if rel_path:
+                    jobs.append(
+                        (
+                            menu,
+                            data_attribute,
+                            f"{config.assets.image_folder}/{rel_path}",
+                        )
+                    )
 
-        return ret
+        results: List = await asyncio.gather(
+            *[asyncio.to_thread(_b64_file, path) for _, _, path in jobs],
+            return_exceptions=True,
+        )
+        for (menu, attribute, path), result in zip(jobs, results):
+            if isinstance(result, Exception):
+                logger.error(
+                    f"Failed to insert image {path} into menu object: {result}"
+                )
+            else:
+                setattr(menu, attribute, result)
+
+        if len(_menus) == 0:
+            return None
+        # If only a single Menu was passed in then return a Menu object
+        return _menus[0] if single else _menus
+
+    @classmethod
+    def invalidate_cache(cls, business_uid: str) -> None:
+        """Drop cached documents for the business. Must be called after any write to the cafe."""
+        with _cache_lock:
+            _cafe_generations[business_uid] = _cafe_generations.get(business_uid, 0) + 1
+            for key in [key for key in _cafe_cache.keys() if key[0] == business_uid]:
+                _cafe_cache.pop(key, None)
 
     @classmethod
-    def cafe_exists(cls, db: DatabaseConfig, business_uid: str) -> bool:
-        ret: int = 0
+    async def cafe_exists(cls, db: DatabaseConfig, business_uid: str) -> bool:
+        ret: bool = False
         try:
-            ret = db.cafes.countDocuments({"business_uid": business_uid})
+            if _cached_cafe(business_uid) is not None:
+                return True
+            # Stops at the first match and only returns the _id.
+            ret = (
+                await db.cafes.find_one({"business_uid": business_uid}, {"_id": 1})
+                is not None
+            )
         except Exception as e:
             logger.error(f"DB exist? error: {e}")
-        return ret > 0
+        return ret
 
     @classmethod
-    def get_cafe(
-        cls, db: DatabaseConfig, business_uid: str, addition_criteria: Dict = None
+    async def get_cafe(
+        cls,
+        db: DatabaseConfig,
+        business_uid: str,
+        addition_criteria: Dict = None,
+        projection: Dict = None,
     ) -> Cafe:
-        """Find a cafe based on business_id and arbitrary, valid pymongo json object"""
+        """
+        Find a cafe based on business_id and arbitrary, valid pymongo json object
+
+        @args:
+            projection: Dict: pymongo projection to limit the fields returned. Fields not returned take their default values in the Cafe.
+        """
         cafe: Cafe = None
         try:
+            cafe_dict: Dict = None
             query_obj = {"business_uid": business_uid}
+            cache_key: Tuple = (business_uid, _projection_key(projection))
             if addition_criteria:
                 query_obj = query_obj | addition_criteria
-            cafe_dict = db.cafes.find_one(query_obj)  # Rerturns a dict
-            cafe = Cafe.from_dict(cafe_dict)
+            else:
+                with _cache_lock:
+                    generation: int = _cafe_generations.get(business_uid, 0)
+                    # A cached full document can serve any projection.
+                    cafe_dict = _cafe_cache.get(cache_key) or _cafe_cache.get(
+                        (business_uid, None)
+                    )
+            if cafe_dict is None:
+                if addition_criteria:
+                    cafe_dict = await db.cafes.find_one(query_obj, projection)
+                else:
+                    cafe_dict = await _read_cafe_batched(db, business_uid, projection)
+                if cafe_dict is not None and not addition_criteria:
+                    with _cache_lock:
+                        # Don't cache a document read before a write that completed during the read.
+                        if _cafe_generations.get(business_uid, 0) == generation:
+                            _cafe_cache[cache_key] = cafe_dict
+            cafe = Cafe.from_db(cafe_dict)
         except Exception as e:
             logger.error(f"No match business found: {e}")
         return cafe
 
     @classmethod
-    def upsert_cafe_settings(
+    async def upsert_cafe_settings(
         cls,
         db: DatabaseConfig,
         business_uid: str,
         updated_partial_cafe: Cafe,
-        skip_fields: List[str] = ["menus"],
+        skip_fields: List[str] = None,
     ):
-        """Update all fields except menus. Menus are not updated via settings UI."""
+        """
+        Update all fields except menus. Menus are not updated via settings UI.
+
+        @args:
+            skip_fields: fields of updated_partial_cafe that are only written if the cafe is new. Defaults to ["menus"].
+        """
         ok: str = False
         msg: str = ""
         try:
-            cafe: Cafe = cls.get_cafe(db, business_uid=business_uid)
-            if cafe is None:
-                cafe = updated_partial_cafe
-            else:
-                for key, value in updated_partial_cafe.__dict__.items():
-                    if skip_fields is None or not (key in skip_fields):
-                        setattr(cafe, key, value)
-            db.cafes.update_one(
-                {"business_uid": business_uid}, {"$set": cafe.to_dict()}, upsert=True
+            skip = frozenset(skip_fields if skip_fields is not None else ("menus",))
+            update: Dict = {"$set": {}, "$setOnInsert": {}}
+            for key, value in updated_partial_cafe.to_dict().items():
+                update["$setOnInsert" if key in skip else "$set"][key] = value
+            # Set the fields in place rather than reading and rewriting the whole cafe.
+            await db.cafes.update_one(
+                {"business_uid": business_uid},
+                {op: fields for op, fields in update.items() if fields},
+                upsert=True,
             )
+            cls.invalidate_cache(business_uid)
             ok = True
         except Exception as e:
             msg = f"A problem occured when upserting cafe settings for business_uid {business_uid}: {e}"
@@ -220,59 +472,157 @@ class MenuHelper:
         return ok, msg
 
     @classmethod
-    def parse_dict(cls, target: Union[Dict, str], keys: Union[str,List[str]] = None, drop_keys: bool = False ) -> Union[Dict, str]:
+    def parse_dict(
+        cls,
+        target: Union[Dict, str],
+        keys: Union[str, List[str]] = None,
+        drop_keys: bool = False,
+    ) -> Dict:
         """
-        Parse and Filter a dictionary or json string.
-        
+        Parse and Filter a dictionary or json string. The target is never modified.
+
         args:
             target: Union[dict|str] The dictionary which is either a dict object or a stringified version.
-            keys: Union[str],list]: Dictionary key or list of keys. 
+            keys: Union[str],list]: Dictionary key or list of keys.
                                     If 'None' then return return the entire dictionary.
-        @args:
-            dictionary
+            drop_keys: bool: if True return the dictionary without keys, otherwise only the keys.
+        @returns:
+            new dictionary. Empty if target couldn't be parsed.
         """
-        ret: Any = None
-        _target: Dict = None
+        _target: Dict = {}
 
         # Parse the target dictionary
         if isinstance(target, str):
             try:
-                _target = json.loads(target)
+                _target = orjson.loads(target)
             except Exception as e:
                 logger.error(f"Error parsing dictionary (dict_parse). {e}")
         elif isinstance(target, Dict):
             _target = target
 
-        # Deal with multiplicity of keys.
         if keys is None:
-            ret = _target
-        else:
-            if not(isinstance(keys, list)) :
-                _keys = [keys]
-            if drop_keys:
-                ret = _target
-            else: 
-                ret = {}
-            for key in keys:
-                if key in _target:
-                    if drop_keys and key in ret:
-                        del ret[key]
-                    else:                       
-                        ret[key]=target[key]
-        return ret
+            return dict(_target)
+        _keys = frozenset((keys,) if isinstance(keys, str) else keys)
+        if drop_keys:
+            return {key: value for key, value in _target.items() if key not in _keys}
+        return {key: _target[key] for key in _keys if key in _target}
 
     @classmethod
-    def get_one_menu(cls, db: DatabaseConfig, business_uid: str, menu_id: str) -> Menu:
+    async def get_one_menu(cls, db: DatabaseConfig, business_uid: str, menu_id: str) -> Menu:
         ret: Menu = None
         try:
-            cafe: Cafe = cls.get_cafe(db, business_uid, {"menus.menu_id": menu_id})
-            ret = [menu for menu in cafe.menus if menu.menu_id == menu_id][0]
+            cafe_dict: Dict = _cached_cafe(business_uid)
+            if cafe_dict is not None:
+                menu_dict: Dict = next(
+                    (
+                        m
+                        for m in cafe_dict.get("menus", [])
+                        if m.get("menu_id") == menu_id
+                    ),
+                    None,
+                )
+            else:
+                # Only the matching menu subdocument is returned.
+                cafe_dict = await db.cafes.find_one(
+                    {"business_uid": business_uid, "menus.menu_id": menu_id},
+                    {"_id": 0, "menus.$": 1},
+                )
+                menu_dict = cafe_dict["menus"][0] if cafe_dict else None
+            if menu_dict is None:
+                raise ValueError(f"menu {menu_id} not found")
+            ret = Menu.from_db(menu_dict)
         except Exception as e:
             logger.warning(f"DB record for cafe {business_uid} not found: {e}")
         return ret
 
     @classmethod
-    def get_menu_list(
+    async def get_cafe_with_menu(
+        cls,
+        db: DatabaseConfig,
+        business_uid: str,
+        menu_id: str,
+        with_menu: bool = True,
+    ) -> Tuple[Dict, Dict]:
+        """
+        Get only the cafe and menu fields needed to configure an agent in a single query.
+
+        @args:
+            with_menu: bool: if False only the cafe fields are fetched and menu is always None.
+        @returns:
+            cafe: {"house_rules", "avatar_settings"} or None if the business isn't found.
+            menu: {"name", "menu_text", "rules"} or None if the business has no such menu.
+        """
+        cafe_fields: Tuple = ("house_rules", "avatar_settings")
+        menu_fields: Tuple = ("name", "menu_text", "rules")
+        cafe: Dict = None
+        menu: Dict = None
+        try:
+            cafe_dict: Dict = _cached_cafe(business_uid)
+            if cafe_dict is not None:
+                # Copy so that callers can't mutate the cached document.
+                cafe = {key: copy.deepcopy(cafe_dict.get(key)) for key in cafe_fields}
+                if with_menu:
+                    menu = next(
+                        (
+                            {key: _menu.get(key) for key in menu_fields}
+                            for _menu in cafe_dict.get("menus", [])
+                            if _menu.get("menu_id") == menu_id
+                        ),
+                        None,
+                    )
+            elif not with_menu:
+                cafe = await db.cafes.find_one(
+                    {"business_uid": business_uid},
+                    {"_id": 0, **{key: 1 for key in cafe_fields}},
+                )
+                if cafe is not None:
+                    cafe = {key: cafe.get(key) for key in cafe_fields}
+            else:
+                # Project the one menu server side rather than transferring and decoding every menu and image path.
+                pipeline: List[Dict] = [
+                    {"$match": {"business_uid": business_uid}},
+                    {"$limit": 1},
+                    {
+                        "$project": {
+                            "_id": 0,
+                            **{key: 1 for key in cafe_fields},
+                            "menu": {
+                                "$arrayElemAt": [
+                                    {
+                                        "$map": {
+                                            "input": {
+                                                "$filter": {
+                                                    "input": {
+                                                        "$ifNull": ["$menus", []]
+                                                    },
+                                                    "as": "m",
+                                                    "cond": {
+                                                        "$eq": ["$$m.menu_id", menu_id]
+                                                    },
+                                                }
+                                            },
+                                            "as": "m",
+                                            "in": {
+                                                key: f"$$m.{key}" for key in menu_fields
+                                            },
+                                        }
+                                    },
+                                    0,
+                                ]
+                            },
+                        }
+                    },
+                ]
+                docs: List[Dict] = await db.cafes.aggregate(pipeline).to_list(length=1)
+                if len(docs) > 0:
+                    menu = docs[0].pop("menu", None)
+                    cafe = {key: docs[0].get(key) for key in cafe_fields}
+        except Exception as e:
+            logger.error(f"Failed to get cafe {business_uid} with menu {menu_id}: {e}")
+        return cafe, menu
+
+    @classmethod
+    async def get_menu_list(
         cls, db: DatabaseConfig, business_uid: str, for_display: bool = True
     ) -> List[Menu]:
         """
@@ -286,12 +636,12 @@ class MenuHelper:
         """
         ret: List[Menu] = []
         try:
-            cafe: Cafe = cls.get_cafe(db, business_uid)
+            cafe: Cafe = await cls.get_cafe(db, business_uid, projection=_NO_IMAGE_DATA)
             ret = cafe.menus
             if for_display:
 
                 def robust_filter(x: Menu):
-                    if "sequence_number" in x.collection:
+                    if x.collection and "sequence_number" in x.collection:
                         if int(x.collection["sequence_number"]) == 0:
                             return True
                         else:
@@ -307,7 +657,99 @@ class MenuHelper:
         return ret
 
     @classmethod
-    def save_menu(
+    async def get_menu_options(
+        cls, db: DatabaseConfig, business_uid: str, utc_minutes: int
+    ) -> List[Dict]:
+        """
+        Get the name and menu_id of the primary menus (see get_menu_list) of a business and whether each is valid at the given time.
+
+        @args:
+            utc_minutes: int: minute of the day, in UTC, to check the menus validity for.
+        @returns:
+            list of {"name", "menu_id", "is_valid"} in the order the menus are stored.
+        """
+
+        def minutes_of_day(key: str) -> Dict:
+            # Menus saved before valid minutes were stored fall back to computing them from the valid_time_range.
+            return {
+                "$ifNull": [
+                    f"$menus.valid_minutes_{key}_utc",
+                    {
+                        "$add": [
+                            {
+                                "$multiply": [
+                                    {"$hour": f"$menus.valid_time_range.{key}"},
+                                    60,
+                                ]
+                            },
+                            {"$minute": f"$menus.valid_time_range.{key}"},
+                        ]
+                    },
+                ]
+            }
+
+        is_valid: Dict = {
+            "$let": {
+                "vars": {
+                    "start": minutes_of_day("start"),
+                    "end": minutes_of_day("end"),
+                },
+                "in": {
+                    "$and": [
+                        {"$ne": ["$$start", None]},
+                        {"$ne": ["$$end", None]},
+                        {
+                            "$cond": [
+                                {"$lte": ["$$start", "$$end"]},
+                                {
+                                    "$and": [
+                                        {"$lte": ["$$start", utc_minutes]},
+                                        {"$gte": ["$$end", utc_minutes]},
+                                    ]
+                                },
+                                # time range straddles midnight.
+                                {
+                                    "$or": [
+                                        {"$gte": [utc_minutes, "$$start"]},
+                                        {"$lte": [utc_minutes, "$$end"]},
+                                    ]
+                                },
+                            ]
+                        },
+                    ]
+                },
+            }
+        }
+
+        pipeline: List[Dict] = [
+            {"$match": {"business_uid": business_uid}},
+            {"$unwind": "$menus"},
+            {
+                "$match": {
+                    "$or": [
+                        {"menus.collection.sequence_number": {"$exists": False}},
+                        {"menus.collection.sequence_number": {"$in": [0, "0"]}},
+                    ]
+                }
+            },
+            {
+                "$project": {
+                    "_id": 0,
+                    "name": "$menus.name",
+                    "menu_id": "$menus.menu_id",
+                    "is_valid": is_valid,
+                }
+            },
+        ]
+        ret: List[Dict] = []
+        try:
+            ret = await db.cafes.aggregate(pipeline).to_list(length=None)
+        except Exception as e:
+            logger.error(f"Failed to get menu options for business {business_uid}: {e}")
+        return ret
+
+    @classmethod
+    async def save_menu(
         cls, db: DatabaseConfig, business_uid: str, new_menu: Menu
     ) -> Tuple[bool, str]:
         """
@@ -317,22 +759,18 @@ class MenuHelper:
             ok: bool
             msg: error message if any
         """
-        cafe: Cafe = cls.get_cafe(db, business_uid=business_uid)
         ok: bool = False
         msg: str = ""
         try:
-            if cafe:
-                cafe.menus.append(new_menu)
-                db.cafes.update_one(
-                    {"business_uid": business_uid}, {"$set": cafe.to_dict()}
-                )
-            else:
-                # Create a new Cafe object and insert it into MongoDB
-                new_cafe: Cafe = Cafe(
-                    business_uid=business_uid,
-                    menus=[Menu.from_dict(new_menu.to_dict())],
-                )  # Hack to overcome corruption of new_menu> Maybe due to how pydantic deals with nested dataclasses?
-                db.cafes.insert_one(new_cafe.to_dict())
+            # Append server side. If the cafe doesn't exist yet, create it with default settings.
+            new_cafe: Dict = Cafe(business_uid=business_uid).to_dict()
+            del new_cafe["menus"]
+            await db.cafes.update_one(
+                {"business_uid": business_uid},
+                {"$push": {"menus": new_menu.to_dict()}, "$setOnInsert": new_cafe},
+                upsert=True,
+            )
+            cls.invalidate_cache(business_uid)
             ok = True
         except Exception as e:
             logger.error(f"Error saving new manu: {e}")
@@ -341,28 +779,23 @@ class MenuHelper:
         return ok, msg
 
     @classmethod
-    def delete_one_menu(
+    async def delete_one_menu(
         cls, db: DatabaseConfig, business_uid: str, menu_id: str
     ) -> Tuple[bool, str, Cafe]:
         ok: bool = False
         msg: str = ""
 
         try:
-            cafe_dict: Dict = db.cafes.find_one(
-                {"business_uid": business_uid, "menus.menu_id": menu_id}
+            result = await db.cafes.update_one(
+                {"business_uid": business_uid},
+                {"$pull": {"menus": {"menu_id": menu_id}}},
             )
-            cafe: Cafe = Cafe.from_dict(cafe_dict)
-            if cafe:
-                menus = [
-                    menu.to_dict() for menu in cafe.menus if menu.menu_id != menu_id
-                ]
-                db.cafes.update_one(
-                    {"business_uid": cafe.business_uid}, {"$set": {"menus": menus}}
-                )
+            if result.modified_count > 0:
+                cls.invalidate_cache(business_uid)
                 ok = True
             else:
                 logger.error(f"menu_id {menu_id} not found. Delete failed.")
-                msg = f"Erorr: Failed to delete menu {str(e)}"
+                msg = f"Erorr: Failed to delete menu {menu_id}. Menu not found."
         except Exception as e:
             logger.error(f"Failed to delete menu with err: {str(e)}")
             ok = False
@@ -371,7 +804,7 @@ class MenuHelper:
         return ok, msg
 
     @classmethod
-    def update_menu_field(
+    async def update_menu_field(
         cls,
         db: DatabaseConfig,
         business_uid: str,
@@ -380,30 +813,17 @@ class MenuHelper:
         field: str = "menu_text",
     ) -> Tuple[bool, str]:
         """Set the menu.f'{field}'= value"""
-        updated = False
         ok: bool = False
         msg: str = ""
         try:
-            # Get the cafe
-            cafe: Cafe = cls.get_cafe(db, business_uid, {"menus.menu_id": menu_id})
-            # Update the selected field
-            for menu in cafe.menus:
-                if menu.menu_id == menu_id:
-                    if hasattr(menu, field):
-                        setattr(menu, field, value)
-                        updated = True
-                        break
-                    else:
-                        logger.error(f"Menu does not have a field called {field}")
-            if updated:
-                _menus = [menu.to_dict() for menu in cafe.menus]
-                db.cafes.update_one(
-                    {"business_uid": cafe.business_uid}, {"$set": {"menus": _menus}}
-                )
-            else:
-                logger.info(
-                    f"No update to {field} for business {business_uid}, menu_id {menu_id}"
-                )
+            # Update the field in place using the positional operator rather than rewriting all menus.
+            result = await db.cafes.update_one(
+                {"business_uid": business_uid, "menus.menu_id": menu_id},
+                {"$set": _menu_field_set(field, value)},
+            )
+            if result.matched_count == 0:
+                raise ValueError("menu not found")
+            cls.invalidate_cache(business_uid)
             ok = True
         except Exception as e:
             msg = f"Failed to update menu {menu_id} for business {business_uid}: {e}"
@@ -411,30 +831,84 @@ class MenuHelper:
         return ok, msg
 
     @classmethod
-    def update_menu(
-        cls, db: DatabaseConfig, business_uid: str, updated_menu: Menu
+    async def bulk_update_menu_fields(
+        cls,
+        db: DatabaseConfig,
+        business_uid: str,
+        updates: List[Tuple[str, str, Any]],
+    ) -> Tuple[bool, str, int]:
+        """
+        Set menu.f'{field}' = value for several menus of a business in a single round trip.
+
+        @args:
+            updates: list of (menu_id, field, value).
+        @returns:
+            ok: bool
+            msg: error message if any
+            count: number of menus modified.
+        """
+        ok: bool = False
+        msg: str = ""
+        count: int = 0
+        if len(updates) == 0:
+            return True, msg, count
+        try:
+            # Validate every update before writing any.
+            operations: List[UpdateOne] = [
+                UpdateOne(
+                    {"business_uid": business_uid, "menus.menu_id": menu_id},
+                    {"$set": _menu_field_set(field, value)},
+                )
+                for menu_id, field, value in updates
+            ]
+        except ValueError as e:
+            msg = f"Invalid menu update for business {business_uid}: {e}"
+            logger.error(msg)
+            return ok, msg, count
+        try:
+            result = await db.cafes.bulk_write(operations, ordered=False)
+            count = result.modified_count
+            ok = True
+        except Exception as e:
+            msg = f"Failed to bulk update menus for business {business_uid}: {e}"
+            logger.error(msg)
+        cls.invalidate_cache(business_uid)
+        return ok, msg, count
+
+    @classmethod
+    async def update_menu(
+        cls, db: DatabaseConfig, business_uid: str, menu_id: str, updated_fields: Dict
     ) -> Tuple[bool, str]:
         """
-        Update a single menu. Menu contains optional fields and so if these are
-        not present, then the current value of the menu to be kept.
+        Update a single menu. Only the fields present in updated_fields are written, the stored values of
+        all other fields are kept.
+
+        @args:
+            updated_fields: Dict: partial menu. Values are validated as a Menu would. menu_id, image data and
+                                  thumbnail_url are ignored.
         """
         ok: bool = False
         msg: str = ""
         try:
-            cafe: Cafe = cls.get_cafe(
-                db, business_uid, {"menus.menu_id": updated_menu.menu_id}
-            )  # Double check
-            _menus = []
-            for menu in cafe.menus:
-                if menu.menu_id == updated_menu.menu_id:
-                    tmp = updated_menu.to_dict()
-                    tmp = menu.to_dict() | tmp
-                    _menus.append(tmp)
-                else:
-                    _menus.append(menu.to_dict())
-            db.cafes.update_one(
-                {"business_uid": business_uid}, {"$set": {"menus": _menus}}
+            fields: Dict = {
+                key: value
+                for key, value in updated_fields.items()
+                if key in Menu.__dataclass_fields__
+                and key not in _MENU_FIELD_UPDATE_REJECTED
+            }
+            if len(fields) == 0:
+                return True, msg
+            validated: Dict = Menu(**fields).to_dict()
+            keys: List[str] = list(fields)
+            if "valid_time_range" in fields:
+                keys.extend(_MENU_DERIVED_FIELDS)
+            result = await db.cafes.update_one(
+                {"business_uid": business_uid, "menus.menu_id": menu_id},
+                {"$set": {f"menus.$.{key}": validated[key] for key in keys}},
             )
+            if result.matched_count == 0:
+                raise ValueError(f"menu {menu_id} not found")
+            cls.invalidate_cache(business_uid)
             ok = True
         except Exception as e:
             msg = f"Error updating one menu: {e}"
@@ -442,28 +916,36 @@ class MenuHelper:
         return ok, msg
 
     @classmethod
-    def count_menus_in_collection(
+    async def count_menus_in_collection(
         cls, db: DatabaseConfig, business_uid: str, grp_id: str
     ) -> int:
         if (
             grp_id and len(grp_id) <= 10
         ):  # TODO - hack to detect whether a UUID4 str wasn't passed in.
             return 0
-        else:
-            count: int = 0
-            cafe: Cafe = cls.get_cafe(db, business_uid=business_uid)
-            if len(cafe.menus) > 0:
-                menus: List[Menu] = [
-                    menu
-                    for menu in cafe.menus
-                    if "grp_id" in menu.collection
-                    and menu.collection["grp_id"] == grp_id
-                ]
-                count = len(menus)
-            return len(menus)
+        # Count on the server so only the number comes back, not the menus.
+        pipeline = [
+            {"$match": {"business_uid": business_uid}},
+            {
+                "$project": {
+                    "_id": 0,
+                    "n": {
+                        "$size": {
+                            "$filter": {
+                                "input": {"$ifNull": ["$menus", []]},
+                                "as": "m",
+                                "cond": {"$eq": ["$$m.collection.grp_id", grp_id]},
+                            }
+                        }
+                    },
+                }
+            },
+        ]
+        docs: List[Dict] = await db.cafes.aggregate(pipeline).to_list(length=1)
+        return docs[0]["n"] if docs else 0
 
     @classmethod
-    def collate_text(
+    async def collate_text(
         cls, db: DatabaseConfig, business_uid: str, grp_id: str
     ) -> Tuple[bool, str, int, str]:
         """
@@ -481,46 +963,124 @@ class MenuHelper:
             primary_menu_id: the menu_id of the menu in the collection that has sequence_numer == 0
         """
 
-        menus: List[Menu] = cls.get_menu_list(db, business_uid)
-        if len(menus) == 0:
+        # Menus in the group as {menu_id, menu_text, seq} in ascending sequence_number order (the order they were added).
+        # Legacy menus without a grp_id are excluded. sequence_number may be stored as a str.
+        group: Dict = {
+            "$sortArray": {
+                "input": {
+                    "$map": {
+                        "input": {
+                            "$filter": {
+                                "input": {"$ifNull": ["$menus", []]},
+                                "as": "m",
+                                "cond": {"$eq": ["$$m.collection.grp_id", grp_id]},
+                            }
+                        },
+                        "as": "m",
+                        "in": {
+                            "menu_id": "$$m.menu_id",
+                            "menu_text": {"$ifNull": ["$$m.menu_text", ""]},
+                            "seq": {
+                                "$convert": {
+                                    "input": "$$m.collection.sequence_number",
+                                    "to": "int",
+                                    "onError": 0,
+                                    "onNull": 0,
+                                }
+                            },
+                        },
+                    }
+                },
+                "sortBy": {"seq": 1},
+            }
+        }
+        # Concatenate the text server side and write it to the primary menu in the same update.
+        collate: List[Dict] = [
+            {
+                "$set": {
+                    "menus": {
+                        "$let": {
+                            "vars": {"grp": group},
+                            "in": {
+                                "$let": {
+                                    "vars": {
+                                        "primary_menu_id": {"$first": "$$grp.menu_id"},
+                                        "all_text": {
+                                            "$reduce": {
+                                                "input": "$$grp.menu_text",
+                                                "initialValue": "",
+                                                "in": {
+                                                    "$concat": ["$$value", "$$this"]
+                                                },
+                                            }
+                                        },
+                                    },
+                                    "in": {
+                                        "$map": {
+                                            "input": "$menus",
+                                            "as": "m",
+                                            "in": {
+                                                "$cond": [
+                                                    {
+                                                        "$eq": [
+                                                            "$$m.menu_id",
+                                                            "$$primary_menu_id",
+                                                        ]
+                                                    },
+                                                    {
+                                                        "$mergeObjects": [
+                                                            "$$m",
+                                                            {"menu_text": "$$all_text"},
+                                                        ]
+                                                    },
+                                                    "$$m",
+                                                ]
+                                            },
+                                        }
+                                    },
+                                }
+                            },
+                        }
+                    }
+                }
+            }
+        ]
+        projection: Dict = {
+            "_id": 0,
+            "collated": {
+                "$let": {
+                    "vars": {"grp": group},
+                    "in": {
+                        "count": {"$size": "$$grp"},
+                        "primary_menu_id": {"$first": "$$grp.menu_id"},
+                    },
+                }
+            },
+        }
+
+        try:
+            result: Dict = await db.cafes.find_one_and_update(
+                {"business_uid": business_uid, "menus.collection.grp_id": grp_id},
+                collate,
+                projection=projection,
+                return_document=ReturnDocument.AFTER,
+            )
+        except Exception as e:
+            logger.error(f"collate_text failed for grp_id=={grp_id}: {e}")
+            return False, str(e), 0, ""
+
+        if result is None:
             return (
                 False,
-                f"No business found with business_uid == {business_uid}",
+                f"No menus with grp_id == {grp_id} found for business_uid == {business_uid}",
                 0,
                 "",
             )
+        cls.invalidate_cache(business_uid)
 
-        def robust_filter(x: Menu) -> bool:
-            if "grp_id" in x.collection:
-                return x.collection["grp_id"] == grp_id
-            else:
-                return False
-
-        primary_menu_id: str = ""
-        menus = list(
-            filter(lambda x: robust_filter(x), menus)
-        )  # Filter out menus that might not have a group_id (legacy)
-        sorted_menus = sorted(
-            menus, key=lambda x: int(x.collection["sequence_number"])
-        )  # Ensure they are in ascending seqeunce_number order ( the order they were added)
-        if len(sorted_menus) > 0:
-            primary_menu_id = sorted_menus[0].menu_id
-
-        all_text = "".join([menu.menu_text for menu in sorted_menus])
-        count = len(menus)
-        ok: bool = False
-        msg: str = ""
-
-        ok, msg = cls.update_menu_field(
-            db,
-            business_uid=business_uid,
-            menu_id=primary_menu_id,
-            value=all_text,
-            field="menu_text",
+        return (
+            True,
+            "",
+            result["collated"]["count"],
+            result["collated"]["primary_menu_id"],
         )
-        if not (ok):
-            count = 0
-            primary_menu_id = ""
-            logger.error(f"collate_text failed for grp_id=={grp_id} ")
-
-        return True, msg, count, primary_menu_id
@@ -8,9 +8,11 @@
 """
 
 import os
+import threading
 import azure.cognitiveservices.speech as speechsdk
 from attrs import define, field, Factory
-from typing import List, Any, Dict, Generator, Iterable, Callable, Tuple
+from typing import List, Any, Dict, Generator, Iterable, Callable, Tuple, Type
+from cachetools import LRUCache
 from griptape.artifacts import TextArtifact
 from voice_chat.utils.text_processing import remove_problem_chars
 
@@ -109,6 +111,10 @@ class AzureTextToSpeech:
             else:
                 return text_for_synth
 
+    def reset(self) -> None:
+        """Clear the per-utterance state so the synthesizer can be reused for another request."""
+        self.full_message = ""
+
     def send_audio_to_speaker(self, text: str) -> None:
         """send to local speaker on server as per audio configuration."""
         if self.audio_config == None:
@@ -185,6 +191,11 @@ class AzureTTSViseme(AzureTextToSpeech):
         self.reset_viseme_log(len(_log))
         return audio_output, _log
 
+    def reset(self) -> None:
+        super().reset()
+        self.viseme_log = []
+        self.index = 0
+
     def reset_viseme_log(self, start_index: int) -> None:
         """
         Its possible that move events have occured since the audio stream yeilded chunks fo the viseme_log
@@ -196,3 +207,49 @@ class AzureTTSViseme(AzureTextToSpeech):
             # logger.debug(f"reset viseme log : {self.index}")
         else:
             self.viseme_log = []
+
+
+@define
+class TTSPool:
+    """
+    Pool of in-memory (audio_config = None) speech synthesizers keyed by class and voice_id.
+    Creating a synthesizer is expensive (SDK configuration and connection setup) so they are reused across requests.
+    A synthesizer holds per-utterance state (e.g. the viseme log) so it is only ever used by one request at a time.
+
+    Usage:
+        tts = pool.acquire(AzureTTSViseme, voice_id)
+        try:
+            ...
+        finally:
+            pool.release(tts)
+    """
+
+    max_voices: int = field(default=64)  # Least recently used voices are dropped.
+    max_idle_per_voice: int = field(default=4)
+    _idle: LRUCache = field(init=False)
+    _lock: threading.Lock = field(init=False, factory=threading.Lock)
+
+    def __attrs_post_init__(self):
+        self._idle = LRUCache(maxsize=self.max_voices)
+
+    def acquire(
+        self, tts_class: Type[AzureTextToSpeech], voice_id: str
+    ) -> AzureTextToSpeech:
+        """Get an idle synthesizer for the voice or create a new one."""
+        with self._lock:
+            idle: List[AzureTextToSpeech] = self._idle.get((tts_class, voice_id))
+            if idle:
+                return idle.pop()
+        return tts_class(voice_id=voice_id, audio_config=None)
+
+    def release(self, tts: AzureTextToSpeech) -> None:
+        """Return the synthesizer to the pool."""
+        tts.reset()
+        key = (type(tts), tts.voice_id)
+        with self._lock:
+            idle: List[AzureTextToSpeech] = self._idle.get(key)
+            if idle is None:
+                idle = []
+                self._idle[key] = idle
+            if len(idle) < self.max_idle_per_voice:
+                idle.append(tts)
@@ -0,0 +1,79 @@
+from cachetools import TTLCache
+
+from voice_chat.yak_agents import AgentRegistry
+
+
+class FakeTimer:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_registry(ttl: float = 10):
+    """Registry whose ttl is measured with a timer that the test advances."""
+    timer = FakeTimer()
+    registry = AgentRegistry(maxsize=4, ttl=ttl)
+    registry._agents = TTLCache(maxsize=4, ttl=ttl, timer=timer)
+    return registry, timer
+
+
+def test_get_registered():
+    registry, _ = make_registry()
+    agent = object()
+    registry.register("s1", agent)
+    assert registry.get("s1") is agent
+    assert "s1" in registry and len(registry) == 1
+
+
+def test_reserved_session_has_no_agent():
+    registry, _ = make_registry()
+    registry.reserve("s1")
+    assert "s1" in registry
+    assert registry.get("s1") is None
+
+
+def test_idle_session_expires():
+    registry, timer = make_registry(ttl=10)
+    registry.register("s1", object())
+    timer.now = 11
+    assert registry.get("s1") is None, "Session outlived its ttl."
+    assert "s1" not in registry
+
+
+def test_get_refreshes_ttl():
+    registry, timer = make_registry(ttl=10)
+    agent = object()
+    registry.register("s1", agent)
+    timer.now = 8
+    assert registry.get("s1") is agent
+    timer.now = 16
+    assert registry.get("s1") is agent, "Accessing a session didn't restart its ttl."
+
+
+def test_expire_counts_evicted():
+    registry, timer = make_registry(ttl=10)
+    registry.register("s1", object())
+    registry.register("s2", object())
+    timer.now = 5
+    registry.register("s3", object())
+    timer.now = 11
+    assert registry.expire() == 2
+    assert len(registry) == 1
+
+
+def test_remove():
+    registry, _ = make_registry()
+    registry.register("s1", object())
+    assert registry.remove("s1") == True
+    assert registry.remove("s1") == False, "Removed a session that didn't exist."
+    assert "s1" not in registry
+
+
+def test_lru_evicted_at_maxsize():
+    registry, _ = make_registry()
+    for i in range(5):
+        registry.register(f"s{i}", object())
+    assert len(registry) == 4
+    assert "s0" not in registry
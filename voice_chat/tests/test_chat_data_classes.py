@@ -0,0 +1,26 @@
+import base64
+
+from voice_chat.data_classes.chat_data_classes import MultiPartResponse
+
+
+def test_multipart_response_framing():
+    frame = MultiPartResponse('{"a": 1}', b"\x00\x01audio").prepare()
+    assert frame == (
+        b"--frame\r\nContent-Type: application/json\r\n\r\n"
+        b'{"a": 1}'
+        b"\r\n--frame\r\nContent-Type: audio/mpeg\r\n\r\n"
+        + base64.b64encode(b"\x00\x01audio")
+        + b"\r\n"
+    ), "Frame parts or delimiters are wrong."
+
+
+def test_multipart_response_bytes_json():
+    assert (
+        MultiPartResponse(b'{"a": 1}', b"").prepare()
+        == MultiPartResponse('{"a": 1}', b"").prepare()
+    ), "json_data as bytes and str framed differently."
+
+
+def test_multipart_response_boundary():
+    frame = MultiPartResponse("{}", b"", boundary="other").prepare()
+    assert frame.startswith(b"--other\r\n") and b"\r\n--other\r\n" in frame
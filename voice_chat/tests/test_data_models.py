@@ -0,0 +1,24 @@
+from voice_chat.data_classes.data_models import Menu, Cafe
+
+
+def test_menu_from_db_none_containers():
+    menu_dict = Menu(collection=None).to_dict()
+    menu_dict["valid_time_range"] = None
+    cafe = Cafe.from_db({"business_uid": "b", "menus": [menu_dict]})
+    assert cafe is not None and len(cafe.menus) == 1
+    assert cafe.menus[0].collection is None
+
+
+def test_menu_from_db_copies_containers():
+    menu_dict = Menu(collection={"grp_id": "g", "sequence_number": "0"}).to_dict()
+    menu = Menu.from_db(menu_dict)
+    menu.collection["grp_id"] = "changed"
+    assert (
+        menu_dict["collection"]["grp_id"] == "g"
+    ), "from_db shared the document's dict."
+
+
+def test_menu_from_db_missing_containers_default():
+    menu = Menu.from_db({"menu_id": "m1"})
+    assert menu.collection == {}
+    assert menu.valid_time_range == {}
@@ -0,0 +1,53 @@
+import pytest
+
+from voice_chat.data_classes.mongodb_helper import MenuHelper, _menu_field_set
+
+
+def test_parse_dict_single_str_key():
+    assert MenuHelper.parse_dict({"voice": "v1", "scale": 2}, "voice") == {
+        "voice": "v1"
+    }, "A str key was treated as a list of characters."
+
+
+def test_parse_dict_missing_keys_ignored():
+    assert MenuHelper.parse_dict({"voice": "v1"}, ["voice", "scale"]) == {"voice": "v1"}
+
+
+def test_parse_dict_drop_keys_leaves_target_untouched():
+    target = {"voice": "v1", "scale": 2}
+    assert MenuHelper.parse_dict(target, ["voice"], drop_keys=True) == {"scale": 2}
+    assert target == {"voice": "v1", "scale": 2}, "parse_dict modified the target."
+
+
+def test_parse_dict_returns_copy():
+    target = {"voice": "v1"}
+    result = MenuHelper.parse_dict(target)
+    result["scale"] = 2
+    assert target == {"voice": "v1"}, "parse_dict returned the target itself."
+
+
+def test_parse_dict_json_string():
+    assert MenuHelper.parse_dict('{"voice": "v1", "scale": 2}', "scale") == {"scale": 2}
+
+
+def test_parse_dict_invalid_json_string():
+    assert MenuHelper.parse_dict("{not json", "voice") == {}
+
+
+def test_menu_field_set_validates_value():
+    assert _menu_field_set("name", "Lunch") == {"menus.$.name": "Lunch"}
+    for field, value in [("collection", "garbage"), ("menu_text", 5), ("rules", 5)]:
+        with pytest.raises(ValueError):
+            _menu_field_set(field, value)
+
+
+def test_menu_field_set_rejects_protected_fields():
+    for field in ["menu_id", "thumbnail_url", "raw_image_data", "no_such_field"]:
+        with pytest.raises(ValueError):
+            _menu_field_set(field, "x")
+
+
+def test_menu_field_set_valid_time_range_writes_minutes():
+    updates = _menu_field_set("valid_time_range", {"start": "2024-01-01T08:30:00Z"})
+    assert updates["menus.$.valid_minutes_start_utc"] == 510
+    assert updates["menus.$.valid_minutes_end_utc"] is None
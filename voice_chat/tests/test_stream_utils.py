@@ -0,0 +1,38 @@
+import asyncio
+
+from voice_chat.utils.stream_utils import multipart_file_upload
+
+
+async def collect(body) -> bytes:
+    return b"".join([chunk async for chunk in body])
+
+
+def test_multipart_file_upload(tmp_path):
+    file_path = tmp_path / "menu.png"
+    file_bytes = bytes(range(256)) * 1000  # Spans several read chunks.
+    file_path.write_bytes(file_bytes)
+
+    headers, body = multipart_file_upload(str(file_path), "file", {"options": "{}"})
+    content = asyncio.run(collect(body))
+
+    boundary = headers["Content-Type"].split("boundary=")[1]
+    assert headers["Content-Type"].startswith("multipart/form-data; ")
+    assert int(headers["Content-Length"]) == len(
+        content
+    ), "Content-Length doesn't match the body."
+    assert content == (
+        f'--{boundary}\r\nContent-Disposition: form-data; name="options"\r\n\r\n{{}}\r\n'
+        f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="menu.png"\r\n'
+        f"Content-Type: image/png\r\n\r\n".encode()
+        + file_bytes
+        + f"\r\n--{boundary}--\r\n".encode()
+    )
+
+
+def test_multipart_file_upload_unknown_type(tmp_path):
+    file_path = tmp_path / "menu"
+    file_path.write_bytes(b"data")
+    headers, body = multipart_file_upload(str(file_path))
+    content = asyncio.run(collect(body))
+    assert b"Content-Type: application/octet-stream\r\n\r\ndata\r\n" in content
+    assert int(headers["Content-Length"]) == len(content)
@@ -1,3 +1,4 @@
 from .data_proxies import DataProxy
+from .id_utils import sid
 
-__all__ = ["DataProxy"]
+__all__ = ["DataProxy", "sid"]
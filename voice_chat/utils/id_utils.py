@@ -0,0 +1,9 @@
+import os
+
+
+def sid() -> str:
+    """
+    Return a random 128 bit identifier as 32 hex characters.
+    Cheaper than str(uuid4()) for internal identifiers (session ids, file ids). Use uuid4 where a canonical hyphenated UUID is expected.
+    """
+    return os.urandom(16).hex()
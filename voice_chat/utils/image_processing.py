@@ -0,0 +1,59 @@
+"""
+Image utilities for menu images. These are CPU bound and should be run off the event loop.
+libvips (pyvips) is used when installed as it decodes and shrinks in a streaming pipeline, with PIL as the fallback.
+"""
+
+import math
+import os
+from PIL import Image
+import logging
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyvips
+except (ImportError, OSError):  # OSError: pyvips installed but libvips isn't.
+    pyvips = None
+
+THUMBNAIL_JPEG_QUALITY = 80
+
+_VIPS_MAX_DIMENSION = 10_000_000
+
+
+def make_thumbnail(src_path: str, dst_path: str, height: int) -> None:
+    """
+    Save a thumbnail of the image at src_path to dst_path.
+
+    Args:
+        src_path: path of the full size image.
+        dst_path: path to save the thumbnail to. The format is taken from the file extension.
+        height: pixel height of the thumbnail. The aspect ratio of the image is preserved.
+    """
+    if pyvips is not None:
+        try:
+            _make_thumbnail_vips(src_path, dst_path, height)
+            return
+        except pyvips.Error as e:
+            logger.warning(f"libvips failed to thumbnail {src_path}, using PIL: {e}")
+    _make_thumbnail_pil(src_path, dst_path, height)
+
+
+def _make_thumbnail_vips(src_path: str, dst_path: str, height: int) -> None:
+    # Width is unconstrained so the thumbnail is sized by height alone. Never upscale, matching PIL's thumbnail().
+    thumb = pyvips.Image.thumbnail(
+        src_path, _VIPS_MAX_DIMENSION, height=height, size="down"
+    )
+    options = {"strip": True}
+    if os.path.splitext(dst_path)[1].lower() in (".jpg", ".jpeg"):
+        options["Q"] = THUMBNAIL_JPEG_QUALITY
+    thumb.write_to_file(dst_path, **options)
+
+
+def _make_thumbnail_pil(src_path: str, dst_path: str, height: int) -> None:
+    with Image.open(src_path) as image:
+        aspect_ratio = image.width / image.height
+        size = (math.floor(height * aspect_ratio), height)
+        # For JPEGs, decode at a reduced DCT scale which is much faster than a full decode. No-op for other formats.
+        image.draft("RGB", (size[0] * 2, size[1] * 2))
+        image.thumbnail(size, Image.LANCZOS)
+        image.save(dst_path, quality=THUMBNAIL_JPEG_QUALITY)
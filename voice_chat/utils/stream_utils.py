@@ -0,0 +1,118 @@
+"""
+Helpers for bridging the blocking (sync) generators of griptape and the Azure SDK into async
+generators that can be handed to fastAPI StreamingResponse without a threadpool hop per chunk,
+and for streaming files out to other services without loading them into memory.
+"""
+
+import asyncio
+import threading
+import os
+import mimetypes
+import aiofiles
+from typing import AsyncIterator, Dict, Iterable, Tuple, TypeVar
+import logging
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+_END_OF_STREAM = object()
+
+_FILE_CHUNK_SIZE = 1 << 16
+
+
+class _ProducerError:
+    """Wraps an exception raised in the producer thread so it can be re-raised in the consumer."""
+
+    def __init__(self, error: BaseException):
+        self.error = error
+
+
+async def iterate_in_thread(iterable: Iterable[T]) -> AsyncIterator[T]:
+    """
+    Drain a blocking iterable in its own daemon thread and yield its items on the event loop.
+
+    Items are handed over via an asyncio.Queue so the event loop is never blocked by the producer
+    and the consumer doesn't pay for a threadpool round trip for every item.
+    If the consumer stops early (e.g. client disconnects) the producer stops at the next item.
+    """
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    stop = threading.Event()
+
+    def _put(item) -> None:
+        try:
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+        except RuntimeError:
+            stop.set()  # Event loop has closed. Nobody left to consume.
+
+    def _produce() -> None:
+        try:
+            for item in iterable:
+                if stop.is_set():
+                    break
+                _put(item)
+        except Exception as e:
+            logger.error(f"Error in streaming producer thread: {e}")
+            _put(_ProducerError(e))
+        finally:
+            _put(_END_OF_STREAM)
+
+    # A dedicated thread per stream rather than the default executor, which is shared with
+    # asyncio.to_thread and only has min(32, cpu+4) workers, so long lived streams would starve it.
+    threading.Thread(target=_produce, name="stream-producer", daemon=True).start()
+    try:
+        while True:
+            item = await queue.get()
+            if item is _END_OF_STREAM:
+                break
+            if isinstance(item, _ProducerError):
+                raise item.error
+            yield item
+    finally:
+        stop.set()
+
+
+def multipart_file_upload(
+    file_path: str, file_field: str = "file", fields: Dict[str, str] = None
+) -> Tuple[Dict[str, str], AsyncIterator[bytes]]:
+    """
+    Build a multipart/form-data request body that streams the file from disk in chunks.
+    Content-Length is computed up front so the receiving server doesn't need to support chunked uploads.
+
+    Args:
+        file_path: path of the file to upload.
+        file_field: form field name for the file.
+        fields: additional (text) form fields.
+
+    Returns:
+        headers, body: pass as httpx `headers=` and `content=`.
+    """
+    boundary = os.urandom(16).hex()
+    content_type = mimetypes.guess_type(file_path)[0] or "application/octet-stream"
+    preamble = b"".join(
+        f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode()
+        for name, value in (fields or {}).items()
+    )
+    preamble += (
+        f"--{boundary}\r\n"
+        f'Content-Disposition: form-data; name="{file_field}"; filename="{os.path.basename(file_path)}"\r\n'
+        f"Content-Type: {content_type}\r\n\r\n"
+    ).encode()
+    epilogue = f"\r\n--{boundary}--\r\n".encode()
+
+    headers = {
+        "Content-Type": f"multipart/form-data; boundary={boundary}",
+        "Content-Length": str(
+            len(preamble) + os.path.getsize(file_path) + len(epilogue)
+        ),
+    }
+
+    async def body() -> AsyncIterator[bytes]:
+        yield preamble
+        async with aiofiles.open(file_path, "rb") as fp:
+            while chunk := await fp.read(_FILE_CHUNK_SIZE):
+                yield chunk
+        yield epilogue
+
+    return headers, body()
@@ -1,6 +1,7 @@
 from .yak_agent import YakAgent
 from .yak_agent import YakStatus
 from .service_agent import ServiceAgent, Provider, Task
+from .agent_registry import AgentRegistry
 
 __all__ = [
     "YakAgent",
@@ -8,4 +9,5 @@ __all__ = [
     "ServiceAgent",
     "Provider",
     "Task",
+    "AgentRegistry",
 ]
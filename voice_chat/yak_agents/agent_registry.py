@@ -0,0 +1,72 @@
+from attrs import define, field
+from typing import Optional
+from cachetools import TTLCache
+import threading
+import logging
+
+from voice_chat.yak_agents.yak_agent import YakAgent
+
+logger = logging.getLogger(__name__)
+
+_MISSING = object()
+
+
+@define
+class AgentRegistry:
+    """
+    Session store holding one YakAgent per session_id.
+    Sessions that haven't been accessed for 'ttl' seconds are evicted, as is the least recently used session once 'maxsize' is reached.
+    Access is guarded by a lock as the registry is shared by async and threadpool executed endpoints.
+
+    Attributes:
+        maxsize: maximum number of sessions held.
+        ttl: seconds of inactivity after which a session expires.
+    """
+
+    maxsize: int = field(default=10_000)
+    ttl: float = field(default=3600)
+    _agents: TTLCache = field(init=False)
+    _lock: threading.RLock = field(init=False, factory=threading.RLock)
+
+    def __attrs_post_init__(self):
+        self._agents = TTLCache(maxsize=self.maxsize, ttl=self.ttl)
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._agents
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._agents)
+
+    def reserve(self, session_id: str) -> None:
+        """Add a placeholder for a session whose agent will be created later."""
+        with self._lock:
+            self._agents[session_id] = None
+
+    def register(self, session_id: str, agent: YakAgent) -> None:
+        with self._lock:
+            self._agents[session_id] = agent
+
+    def get(self, session_id: str) -> Optional[YakAgent]:
+        """Return the agent for the session, or None if it doesn't exist or is only reserved. Refreshes the session ttl."""
+        with self._lock:
+            agent = self._agents.get(session_id, _MISSING)
+            if agent is _MISSING:
+                return None
+            self._agents[session_id] = agent  # Re-insert to restart the ttl.
+            return agent
+
+    def remove(self, session_id: str) -> bool:
+        """Remove the session. Returns False if there was no such session."""
+        with self._lock:
+            return self._agents.pop(session_id, _MISSING) is not _MISSING
+
+    def expire(self) -> int:
+        """Evict expired sessions now rather than waiting for them to be pushed out. Returns the number evicted."""
+        with self._lock:
+            expired = self._agents.expire()
+        count = len(expired) if expired is not None else 0
+        if count > 0:
+            logger.info(f"Expired {count} idle sessions.")
+        return count
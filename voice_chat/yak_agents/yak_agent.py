@@ -18,6 +18,7 @@ from griptape.rules import Rule, Ruleset
 from transformers import AutoTokenizer
 import os
 import json
+import threading
 import logging
 from omegaconf import OmegaConf
 
@@ -83,6 +84,8 @@ class YakAgent:
     agent_status: YakStatus = field(
         default=YakStatus.IDLE
     )  # Access via status property
+    # Mirrors status == TALKING so streaming loops can poll for interrupts without comparing enums.
+    _talking: threading.Event = field(init=False, factory=threading.Event, repr=False)
 
     voice_id: str = field()  # Agent voice id from STT provider.
     avatar_config: Dict = field(default=Factory(dict))  # Primarily for avatar animations.
@@ -152,6 +155,15 @@ class YakAgent:
     @status.setter
     def status(self, value: YakStatus):
         self.agent_status = value
+        if value == YakStatus.TALKING:
+            self._talking.set()
+        else:
+            self._talking.clear()
+
+    @property
+    def is_talking(self) -> bool:
+        """False once the status has moved off TALKING e.g. the client has interrupted the speech."""
+        return self._talking.is_set()
 
     def run(self, *args, **kwargs):
         return self.agent.run(*args, **kwargs)